@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+"""
+This file contains methods for storing and accessing ensembles of geological models, created using the 2-step-conditioning workflow developed in the project Pilot Study Geothermics Aargau.
+
+Lith blocks of an ensemble are stored as compact unsigned integer codes together with a lookup table of the unit IDs,
+either in memory, in compressed npz files or in an appendable HDF5 container for the Monte Carlo generation loop.
+"""
+
+# Libraries
+import os
+import hashlib
+import numpy as np
+import h5py
+
+__author__ = "Jan Niederau"
+__license__ = "MIT"
+__version__ = "0.0.1"
+__maintainer__ = "Jan Niederau"
+__status__ = "Prototype"
+
+class LithEnsemble:
+    """Ensemble of lith blocks stored as compact codes (uint8 or uint16) and a lookup table of unit IDs.
+
+    Indexing returns decoded unit IDs, e.g. `ensemble[3]` is the lith block of realization 3 and
+    `ensemble[10:20]` the lith blocks of realizations 10 to 19. So an ensemble can be passed to OpenWF
+    methods taking an array of lith blocks, with only the requested realizations being decoded.
+
+    Args:
+        codes (array-like): codes of the lith blocks, shape (n_realizations, n_cells). Can be a numpy array,
+                            a np.memmap or an h5py dataset.
+        lut (np.array): lookup table, unit ID of each code
+    """
+    def __init__(self, codes, lut):
+        self.codes = codes
+        self.lut = np.asarray(lut)
+
+    @property
+    def shape(self):
+        return tuple(self.codes.shape)
+
+    @property
+    def ndim(self):
+        return len(self.codes.shape)
+
+    @property
+    def dtype(self):
+        return self.lut.dtype
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def __getitem__(self, index):
+        return self.lut[self.codes[index]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __array__(self, dtype=None, copy=None):
+        blocks = self[:]
+        if dtype is not None:
+            blocks = blocks.astype(dtype)
+        return blocks
+
+    def __repr__(self):
+        return f"LithEnsemble({len(self)} realizations, {self.shape[1]} cells, units {self.lut.tolist()})"
+
+def _code_dtype(n_ids: int):
+    if n_ids <= np.iinfo(np.uint8).max + 1:
+        return np.uint8
+    elif n_ids <= np.iinfo(np.uint16).max + 1:
+        return np.uint16
+    raise ValueError(f"{n_ids} different unit IDs can not be stored as uint16 codes.")
+
+def encode_lith_blocks(lith_blocks, chunk_size: int=64):
+    """Round lith blocks to integer unit IDs and encode them as compact codes with a lookup table.
+
+    Args:
+        lith_blocks (np.array): lith blocks of an ensemble, shape (n_realizations, n_cells)
+        chunk_size (int, optional): number of realizations processed at once. Defaults to 64.
+
+    Returns:
+        LithEnsemble: encoded ensemble, codes are uint8 for up to 256 different unit IDs, uint16 otherwise
+    """
+    if isinstance(lith_blocks, LithEnsemble):
+        return lith_blocks
+    lith_blocks = np.atleast_2d(lith_blocks)
+    n = len(lith_blocks)
+
+    lut = np.array([], dtype=int)
+    for i in range(0, n, chunk_size):
+        ids = np.rint(lith_blocks[i:i+chunk_size]).astype(int)
+        lut = np.union1d(lut, ids)
+
+    codes = np.empty(lith_blocks.shape, dtype=_code_dtype(len(lut)))
+    for i in range(0, n, chunk_size):
+        ids = np.rint(lith_blocks[i:i+chunk_size]).astype(int)
+        codes[i:i+chunk_size] = np.searchsorted(lut, ids)
+
+    return LithEnsemble(codes, lut)
+
+def save_lith_ensemble(filepath: str, lith_blocks):
+    """Save lith blocks of an ensemble compressed as compact codes with lookup table (npz file).
+
+    Args:
+        filepath (str): path of the npz file
+        lith_blocks (np.array or LithEnsemble): lith blocks of the ensemble, shape (n_realizations, n_cells)
+    """
+    ensemble = encode_lith_blocks(lith_blocks)
+    np.savez_compressed(filepath, codes=np.asarray(ensemble.codes), lut=ensemble.lut)
+
+def load_lith_ensemble(filepath: str, mmap: bool=True):
+    """Load an ensemble saved with save_lith_ensemble.
+
+    As compressed arrays can not be memory-mapped, the codes are decompressed once into an npy file
+    next to the npz file (`<filepath>.codes.npy`), which is then memory-mapped. The npy file is
+    regenerated whenever the npz file is newer.
+
+    Args:
+        filepath (str): path of the npz file
+        mmap (bool, optional): memory-map the codes. If False, codes are loaded into memory. Defaults to True.
+
+    Returns:
+        LithEnsemble: ensemble of lith blocks
+    """
+    with np.load(filepath) as store:
+        lut = store['lut']
+        if not mmap:
+            return LithEnsemble(store['codes'], lut)
+
+        codes_file = filepath + '.codes.npy'
+        if not os.path.exists(codes_file) or os.path.getmtime(codes_file) < os.path.getmtime(filepath):
+            np.save(codes_file, store['codes'])
+
+    return LithEnsemble(np.load(codes_file, mmap_mode='r'), lut)
+
+class EnsembleStore:
+    """Appendable HDF5 container for a Monte Carlo ensemble, filled realization by realization.
+
+    Lith blocks are stored as uint8 codes (see LithEnsemble), the lookup table of unit IDs grows as new IDs appear. 
+    Optional per-realization arrays, e.g. the forward gravity `fw_gravity` and the sampled depth variations 
+    `Z_var`, are stored in datasets of the same name. All datasets are chunked along the realization axis, so 
+    appending keeps memory flat and later analysis can read them chunk by chunk with `iter_chunks`.
+
+    Args:
+        filepath (str): path of the HDF5 file
+        mode (str, optional): h5py file mode, 'a' appends to an existing container, 'w' overwrites it, 'r' reads only. Defaults to 'a'.
+        compression (str, optional): h5py compression filter of the lith blocks. Defaults to 'gzip'.
+
+    Example:
+        >>> with EnsembleStore('MC_ensemble.h5', mode='w') as store:
+        >>>     for i in range(n_iterations):
+        >>>         ...
+        >>>         store.append(geo_model.solutions.lith_block, fw_gravity=geo_model.solutions.fw_gravity, Z_var=Z_var)
+    """
+    def __init__(self, filepath: str, mode: str='a', compression: str='gzip'):
+        self.file = h5py.File(filepath, mode)
+        self.compression = compression
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def __len__(self):
+        if 'lith_blocks' not in self.file:
+            return 0
+        return self.file['lith_blocks'].shape[0]
+
+    @property
+    def lut(self):
+        return self.file['lith_blocks'].attrs['lut']
+
+    @property
+    def lith_blocks(self):
+        """LithEnsemble reading the lith blocks lazily from the HDF5 file"""
+        return LithEnsemble(self.file['lith_blocks'], self.lut)
+
+    def _append_row(self, name: str, values, dtype, compression=None):
+        values = np.asarray(values, dtype=dtype).ravel()
+        if name not in self.file:
+            self.file.create_dataset(name, shape=(0, values.size), maxshape=(None, values.size),
+                                     chunks=(1, values.size), dtype=dtype, compression=compression)
+        dset = self.file[name]
+        if dset.shape[1] != values.size:
+            raise ValueError(f"Expected {dset.shape[1]} values for {name}, got {values.size}.")
+        n = dset.shape[0]
+        dset.resize(n + 1, axis=0)
+        dset[n] = values
+
+    def _encode(self, lith_block):
+        ids = np.rint(np.asarray(lith_block)).astype(int).ravel()
+        dset = self.file.get('lith_blocks')
+        lut = np.array([], dtype=int) if dset is None else dset.attrs['lut']
+        
+        # new unit IDs are added to the end of the table, so existing codes stay valid
+        new_ids = np.setdiff1d(ids, lut)
+        if new_ids.size > 0:
+            lut = np.concatenate((lut, new_ids))
+            if lut.size > np.iinfo(np.uint8).max + 1:
+                raise ValueError(f"{lut.size} different unit IDs can not be stored as uint8 codes.")
+        order = np.argsort(lut)
+        codes = order[np.searchsorted(lut[order], ids)]
+        
+        return codes, lut
+
+    def append(self, lith_block, **arrays):
+        """Append one realization to the container.
+
+        Args:
+            lith_block (np.array): lith block of the realization, e.g. geo_model.solutions.lith_block
+            **arrays: further per-realization arrays stored under their keyword, e.g. fw_gravity=..., Z_var=...
+        """
+        codes, lut = self._encode(lith_block)
+        self._append_row('lith_blocks', codes, np.uint8, compression=self.compression)
+        self.file['lith_blocks'].attrs['lut'] = lut
+        
+        for name, values in arrays.items():
+            self._append_row(name, values, np.float64)
+        self.file.flush()
+
+    def iter_chunks(self, name: str='lith_blocks', chunk_size: int=64):
+        """Iterate over a dataset in chunks of realizations.
+
+        Args:
+            name (str, optional): name of the dataset. Defaults to 'lith_blocks'.
+            chunk_size (int, optional): number of realizations per chunk. Defaults to 64.
+
+        Yields:
+            tuple: (start, values), index of the first realization in the chunk and its values. 
+                   Lith blocks are decoded to unit IDs.
+        """
+        data = self.lith_blocks if name == 'lith_blocks' else self.file[name]
+        for start in range(0, len(data), chunk_size):
+            yield start, data[start:start+chunk_size]
+
+    def __getitem__(self, name: str):
+        """Read a complete per-realization dataset, lith blocks are decoded to unit IDs."""
+        if name == 'lith_blocks':
+            return self.lith_blocks[:]
+        return self.file[name][:]
+
+def unique_realizations(lith_blocks, chunk_size: int=64):
+    """Find realizations with identical lith blocks, so each distinct model only has to be exported and simulated once.
+    Realizations are compared by a hash of their uint8 codes, the first realization of each group is the canonical one.
+
+    Args:
+        lith_blocks (np.array or LithEnsemble): lith blocks of the ensemble, shape (n_realizations, n_cells)
+        chunk_size (int, optional): number of realizations processed at once. Defaults to 64.
+
+    Returns:
+        tuple: (unique, inverse), indices of the canonical realizations and, for every realization, the position
+               of its canonical realization in unique, i.e. lith_blocks[unique][inverse] equals lith_blocks
+    """
+    ensemble = encode_lith_blocks(lith_blocks, chunk_size=chunk_size)
+    n = len(ensemble)
+    
+    groups = {}
+    unique = []
+    inverse = np.empty(n, dtype=int)
+    for start in range(0, n, chunk_size):
+        codes = np.asarray(ensemble.codes[start:start+chunk_size])
+        for i, row in enumerate(codes, start):
+            key = hashlib.blake2b(np.ascontiguousarray(row).tobytes(), digest_size=16).digest()
+            if key not in groups:
+                groups[key] = len(unique)
+                unique.append(i)
+            inverse[i] = groups[key]
+    
+    return np.array(unique, dtype=int), inverse
+
+def expand_unique(results, inverse):
+    """Fan out results of the canonical realizations to all realizations of the ensemble, e.g. for rejection and statistics.
+
+    Args:
+        results (array-like or list): one result per canonical realization, in the order of unique (see unique_realizations)
+        inverse (np.array): position of the canonical realization of every realization, from unique_realizations
+
+    Returns:
+        np.array or list: one result per realization
+    """
+    if isinstance(results, list):
+        return [results[k] for k in inverse]
+    return np.asarray(results)[inverse]
+
+def write_realization_map(filepath: str, model_names: list, inverse):
+    """Write which model represents each realization of a deduplicated ensemble as csv file (columns realization, model).
+
+    Args:
+        filepath (str): path of the csv file
+        model_names (list): names of the exported models of the canonical realizations
+        inverse (np.array): position of the canonical realization of every realization, from unique_realizations
+    """
+    with open(filepath, 'w') as file:
+        file.write("realization,model\n")
+        for realization, k in enumerate(inverse):
+            file.write(f"{realization},{model_names[k]}\n")
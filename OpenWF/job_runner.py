@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+"""
+This file contains methods for running the SHEMAT-Suite models listed in a shemade.job file, created using the 2-step-conditioning workflow developed in the project Pilot Study Geothermics Aargau.
+
+Models are run on a pool of local workers, failed runs are retried and the status of every model is kept in a state file, so an interrupted ensemble can be resumed.
+"""
+
+# Libraries
+import os
+import json
+import time
+import threading
+import subprocess
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+__author__ = "Jan Niederau"
+__license__ = "MIT"
+__version__ = "0.0.1"
+__maintainer__ = "Jan Niederau"
+__status__ = "Prototype"
+
+def read_job_file(job_file: str):
+    """Read the model names listed in a shemade.job file.
+
+    Args:
+        job_file (str): path to the job file
+
+    Returns:
+        list: model names
+    """
+    with open(job_file, 'r') as file:
+        models = [line.strip() for line in file]
+
+    return [model for model in models if model]
+
+def load_state(state_file: str):
+    """Load the state file of a job run.
+
+    Args:
+        state_file (str): path to the state file
+
+    Returns:
+        dict: status per model, with the keys 'status' ('done' or 'failed'), 'returncode', 'attempts' and 'runtime'
+    """
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, 'r') as file:
+        return json.load(file)
+
+def _save_state(state: dict, state_file: str):
+    # write to a temporary file first, so an interruption never leaves a broken state file
+    tmp_file = state_file + '.tmp'
+    with open(tmp_file, 'w') as file:
+        json.dump(state, file, indent=1)
+    os.replace(tmp_file, state_file)
+
+def _input_size(model: str, path: str):
+    input_file = os.path.join(path, model)
+    return os.path.getsize(input_file) if os.path.exists(input_file) else 0
+
+def _schedule(models: list, state: dict, path: str):
+    """Order models so the slowest ones start first. The expected runtime is estimated from the input file size, scaled by the
+    runtime per byte of models which finished before. Failed attempts only count if they ran longer, e.g. after a timeout."""
+    rates = [s['runtime'] / _input_size(m, path) for m, s in state.items()
+             if s.get('status') == 'done' and _input_size(m, path) > 0]
+    rate = statistics.median(rates) if rates else None
+
+    def cost(model):
+        size = _input_size(model, path)
+        if rate is None:
+            return size
+        return max(size * rate, state.get(model, {}).get('runtime', 0.))
+
+    return sorted(models, key=cost, reverse=True)
+
+def run_shemade_job(job_file: str, executable: str, args: tuple=('{model}',), n_workers: int=1,
+                    retries: int=1, state_file: str=None, log_dir: str=None, timeout: float=None,
+                    verbose: bool=True):
+    """Run all models listed in a shemade.job file with a local pool of workers.
+
+    Every model is run as `executable *args` in the folder of the job file, where '{model}' in args is
+    replaced by the model name. The executable can be SHEMAT-Suite or any stand-in script for testing.
+    Output of all attempts is written to `<model>.log`. Finished models are recorded in the state file and
+    skipped when the job is run again, so an interrupted ensemble resumes where it stopped.
+
+    Args:
+        job_file (str): path to the job file
+        executable (str): executable run for every model, e.g. the path to the SHEMAT-Suite binary
+        args (tuple, optional): arguments of the executable. Defaults to ('{model}',).
+        n_workers (int, optional): number of models run at the same time. Defaults to 1.
+        retries (int, optional): number of times a failed model is rerun. Defaults to 1.
+        state_file (str, optional): path to the state file. Defaults to None, i.e. `<job_file>.state.json`.
+        log_dir (str, optional): folder of the log files. Defaults to None, i.e. the folder of the job file.
+        timeout (float, optional): maximum runtime of a single run in seconds. Defaults to None.
+        verbose (bool, optional): print the result of every run. Defaults to True.
+
+    Returns:
+        dict: status per model, see load_state
+    """
+    path = os.path.dirname(os.path.abspath(job_file))
+    if state_file is None:
+        state_file = job_file + '.state.json'
+    if log_dir is None:
+        log_dir = path
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    state = load_state(state_file)
+    models = [m for m in read_job_file(job_file) if state.get(m, {}).get('status') != 'done']
+    models = _schedule(models, state, path)
+    if verbose:
+        print(f"Running {len(models)} models, {len(read_job_file(job_file)) - len(models)} already done.")
+
+    lock = threading.Lock()
+
+    def run(model):
+        attempts = state.get(model, {}).get('attempts', 0)
+        command = [executable] + [a.format(model=model) for a in args]
+        for attempt in range(retries + 1):
+            start = time.time()
+            # keep the output of failed attempts in the log
+            with open(os.path.join(log_dir, f"{model}.log"), 'w' if attempt == 0 else 'a') as log:
+                try:
+                    returncode = subprocess.run(command, cwd=path, stdout=log, stderr=subprocess.STDOUT,
+                                                timeout=timeout).returncode
+                except subprocess.TimeoutExpired:
+                    log.write(f"\nTimeout after {timeout} s.\n")
+                    returncode = None
+                except OSError as error:
+                    # e.g. a missing or non-executable binary
+                    log.write(f"\nCould not run {command}: {error}\n")
+                    returncode = None
+
+            status = 'done' if returncode == 0 else 'failed'
+            with lock:
+                state[model] = {'status': status, 'returncode': returncode,
+                                'attempts': attempts + attempt + 1, 'runtime': time.time() - start}
+                _save_state(state, state_file)
+            if verbose:
+                print(f"{model}: {status} (return code {returncode}, attempt {attempt + 1})")
+            if status == 'done':
+                break
+
+        return model, status
+
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        list(pool.map(run, models))
+
+    if verbose:
+        failed = [m for m, s in state.items() if s['status'] != 'done']
+        print(f"Finished, {len(failed)} models failed: {failed}")
+
+    return state
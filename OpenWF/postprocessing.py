@@ -7,7 +7,10 @@ Methods comprise plotting and calculation of parameters, such as the heatflow.
 """
 
 # import some libraries
-from scipy.stats import hmean
+import os
+import copy
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import random
 import pandas as pd
 import numpy as np
@@ -38,6 +41,136 @@ def read_hdf_file(filepath: str=".", write: bool=False):
 
     return model_fid
 
+class ShematResult:
+    """Lazy access to the HDF5 result file of a SHEMAT-Suite simulation, reading only the hyperslabs needed.
+
+    Fields in SHEMAT-Suite result files have the shape (nz, ny, nx). The 1D coordinate axes x, y, z are read once and cached. 
+    Slices, columns and sub-volumes are read with `read_direct` into buffers, which are kept per dataset and shape and reused 
+    by the next read of the same dataset and shape. So the returned arrays are overwritten by that read, use copy=True to keep them.
+
+    Args:
+        file (str, h5py.File or ShematResult): path of the result file, or an open file. An open file is not closed by the 
+                                               ShematResult.
+        mode (str, optional): h5py file mode if a path is given. Defaults to 'r'.
+
+    Example:
+        >>> with ShematResult('POC_MC_0_final.h5') as result:
+        >>>     temp = result.slice('temp', direction='y', index=25)
+        >>>     log = result.column('temp', i=50, j=25)
+    """
+    def __init__(self, file, mode: str='r'):
+        self._axes = {}
+        if isinstance(file, ShematResult):
+            self.file = file.file
+            self._axes = file._axes
+            self._owns_file = False
+        elif isinstance(file, h5py.File):
+            self.file = file
+            self._owns_file = False
+        else:
+            self.file = h5py.File(file, mode)
+            self._owns_file = True
+        self._buffers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._owns_file:
+            self.file.close()
+        self._buffers = {}
+
+    def __contains__(self, name: str):
+        return name in self.file
+
+    def __getitem__(self, name: str):
+        """Read a complete dataset"""
+        return self._dataset(name)[()]
+
+    def keys(self):
+        return self.file.keys()
+
+    def _dataset(self, name: str):
+        try:
+            return self.file[name]
+        except KeyError:
+            raise KeyError(f"Unable to open {name}. Does not exist in HDF5 File. See method 'available_parameters' for existing parameters.")
+
+    @property
+    def shape(self):
+        """shape (nz, ny, nx) of the model fields"""
+        return self.file['temp'].shape if 'temp' in self.file else self.file['uindex'].shape
+
+    def _axis(self, name: str, selection: tuple):
+        if name not in self._axes:
+            self._axes[name] = self.file[name][selection]
+        return self._axes[name]
+
+    @property
+    def x(self):
+        return self._axis('x', np.s_[0, 0, :])
+
+    @property
+    def y(self):
+        return self._axis('y', np.s_[0, :, 0])
+
+    @property
+    def z(self):
+        return self._axis('z', np.s_[:, 0, 0])
+
+    def read(self, name: str, selection: tuple, copy: bool=False):
+        """Read a hyperslab of a dataset into a reusable buffer.
+
+        Args:
+            name (str): name of the dataset, e.g. 'temp'
+            selection (tuple): hyperslab of integers and slices, e.g. np.s_[10:20, :, 5]
+            copy (bool, optional): return a copy instead of the buffer. Defaults to False.
+
+        Returns:
+            np.ndarray: values of the hyperslab
+        """
+        dset = self._dataset(name)
+        shape = tuple(len(range(*s.indices(n))) for s, n in zip(selection, dset.shape) if isinstance(s, slice))
+        key = (name, shape)
+        if key not in self._buffers:
+            self._buffers[key] = np.empty(shape, dtype=dset.dtype)
+        buffer = self._buffers[key]
+        dset.read_direct(buffer, source_sel=selection)
+        
+        return buffer.copy() if copy else buffer
+
+    def slice(self, name: str, direction: str='x', index: int=0, copy: bool=False):
+        """Read a 2D slice normal to the x, y or z direction.
+
+        Args:
+            name (str): name of the dataset
+            direction (str, optional): normal direction of the slice, 'x' returns (nz, ny), 'y' (nz, nx) and 'z' (ny, nx). Defaults to 'x'.
+            index (int, optional): cell index of the slice. Defaults to 0.
+            copy (bool, optional): return a copy instead of the buffer. Defaults to False.
+        """
+        selections = {'x': np.s_[:, :, index], 'y': np.s_[:, index, :], 'z': np.s_[index, :, :]}
+        if direction not in selections:
+            raise ValueError(f"Unknown direction {direction}, use 'x', 'y' or 'z'.")
+        
+        return self.read(name, selections[direction], copy=copy)
+
+    def column(self, name: str, i: int, j: int, copy: bool=False):
+        """Read the vertical column (nz,) at cell indices i (x direction) and j (y direction), e.g. a synthetic borehole log."""
+        return self.read(name, np.s_[:, j, i], copy=copy)
+
+    def subvolume(self, name: str, z: slice=None, y: slice=None, x: slice=None, copy: bool=False):
+        """Read a sub-volume given by slices of the cell indices in z, y and x direction, None selects the full axis."""
+        selection = tuple(np.s_[:] if s is None else s for s in (z, y, x))
+        return self.read(name, selection, copy=copy)
+
+    def cell_index(self, x: float=None, y: float=None, z: float=None):
+        """Indices of the cells nearest to the given coordinates, None for coordinates not given."""
+        return tuple(None if value is None else find_nearest(axis, value) 
+                     for value, axis in [(x, self.x), (y, self.y), (z, self.z)])
+
 def available_parameters(file: h5py.File):
     """Return a summary of available parameters in the simulation file
 
@@ -97,19 +230,14 @@ def plot_slice(file, parameter: str='temp', direction: str='x', cell_number: int
         cell_number (int, optional): cell number at which the slice is plotted. Defaults to 0.
         model_depth (float, optional): model depth in meter above sea level. So if it extends 3 km below sea lvl, enter 3000. Defaults to None.
     """
-    if type(file)==str:
-        f = read_hdf_file(file)
-    else:
-        f = file
-    try:
-        param = f[parameter][:,:,:]
-    except KeyError:
-        raise(f"Unable to open {parameter}. Does not exist in HDF5 File. See method 'available_parameters' for existing parameters.")
-
-    uindex = f['uindex'][:,:,:]
-    x = f['x'][0,0,:]
-    y = f['y'][0,:,0]
-    z = f['z'][:,0,0]
+    with ShematResult(file) as result:
+        x = result.x
+        y = result.y
+        z = result.z
+        
+        if direction in ['x', 'y', 'z']:
+            pa_cs = result.slice(parameter, direction, cell_number)
+            ui_cs = result.slice('uindex', direction, cell_number)
     
     if model_depth == None:
         z_extent = z[0] + z[-1]
@@ -117,9 +245,6 @@ def plot_slice(file, parameter: str='temp', direction: str='x', cell_number: int
         z_extent = model_depth
     
     if direction=='x':
-        pa_cs = param[:,:,cell_number]
-        ui_cs = uindex[:,:,cell_number]
-        
         cs = plt.contourf(y,z-z_extent,pa_cs,23,cmap='viridis')
         plt.contour(y,z-z_extent,ui_cs, colors='#222222')
         plt.title(f'{parameter},x-direction, cell {cell_number}', fontsize=16)
@@ -133,9 +258,6 @@ def plot_slice(file, parameter: str='temp', direction: str='x', cell_number: int
         plt.show()
     
     elif direction=='y':
-        pa_cs = param[:,cell_number,:]
-        ui_cs = uindex[:,cell_number,:]
-    
         cs = plt.contourf(x,z-z_extent,pa_cs,23,cmap='viridis')
         plt.contour(x,z-z_extent,ui_cs, colors='#222222')
         plt.title(f'{parameter},y-direction, cell {cell_number}', fontsize=16)
@@ -149,12 +271,9 @@ def plot_slice(file, parameter: str='temp', direction: str='x', cell_number: int
         plt.show()
         
     elif direction=='z':
-        pa_cs = param[cell_number,:,:]
-        ui_cs = uindex[cell_number,:,:]
-        
         cs = plt.contourf(x,y,pa_cs,23,cmap='viridis')
         plt.contour(x,y,ui_cs, colors='#222222')
-        plt.title(f'{parameter}, z-direction, {z[cell_number]-model_depth} m a.s.l.', fontsize=16)
+        plt.title(f'{parameter}, z-direction, {z[cell_number]-z_extent} m a.s.l.', fontsize=16)
         plt.tick_params(axis='both',labelsize=14)
         plt.xlabel('x [m]',fontsize=16)
         plt.ylabel('y [m]',fontsize=16)
@@ -179,8 +298,119 @@ def find_nearest(array, value):
     
     return idx
 
+class IntervalHeatFlow:
+    """Precomputed per-column structure for the vertical conductive heat flow over arbitrary depth intervals.
+
+    Stores the temperature at each node and per-column prefix sums of the thermal resistance dz/lz, as well as the prefix 
+    sums of dz. The heat flow over an interval is then a lookup of a few layers per column, for all columns at once, 
+    instead of a new gradient and harmonic mean over the interval slab. Use interval_heat_flow to get a cached instance per result file.
+
+    The temperature and depth differences reproduce the sum of np.gradient over the interval nodes, the thermal conductivity 
+    is the thickness-weighted harmonic mean of lz, which equals scipy.stats.hmean for a regular vertical discretization.
+
+    Args:
+        data (h5py.File): HDF5 file with simulated variables, or a ShematResult
+        model_depth (float, optional): vertical extent of the model in meter. Defaults to 6000..
+        chunk_size (int, optional): number of z-layers read at once while building the prefix sums. Defaults to 32.
+    """
+    def __init__(self, data, model_depth: float=6000., chunk_size: int=32):
+        with ShematResult(data) as result:
+            nz, ny, nx = result.shape
+            self.z = result.z.copy()
+            dz = result.read('delz', np.s_[:, 0, 0], copy=True)
+            self.dz_sum = np.concatenate(([0.], np.cumsum(dz)))
+            self.temp = result['temp']
+            
+            self.resistance_sum = np.zeros((nz + 1, ny, nx))
+            for start in range(0, nz, chunk_size):
+                stop = min(start + chunk_size, nz)
+                resistance = dz[start:stop, None, None] / result.subvolume('lz', z=slice(start, stop))
+                np.cumsum(resistance, axis=0, out=self.resistance_sum[start+1:stop+1])
+                self.resistance_sum[start+1:stop+1] += self.resistance_sum[start]
+        self.zasl = self.z - model_depth
+
+    def with_model_depth(self, model_depth: float):
+        """The same structure for another vertical model extent, sharing the precomputed arrays"""
+        other = copy.copy(self)
+        other.zasl = self.z - model_depth
+        return other
+
+    def indices(self, depth_interval: list):
+        """z-indices (upper, lower) of the nodes nearest to a depth interval [deeper, shallower]"""
+        return find_nearest(self.zasl, depth_interval[0]), find_nearest(self.zasl, depth_interval[1])
+
+    @staticmethod
+    def _gradient_sum(values, first: int, last: int):
+        # sum of np.gradient over nodes first..last collapses to the end nodes
+        if last - first == 1:
+            return 2.0 * (values[last] - values[first])
+        return 1.5*values[last] - 0.5*values[last-1] - 1.5*values[first] + 0.5*values[first+1]
+
+    def heat_flow(self, depth_interval: list, direction: bool=False):
+        """Heat flow map over a depth interval
+
+        Args:
+            depth_interval (list): list of depth interval with [deeper, shallower] values
+            direction (boolean, optional): if set to True, direction of heatflow will be included, i.e. negative heat flows for outward ones
+
+        Returns:
+            hf [array]: average heat flow over the defined depth interval, shape (ny, nx)
+        """
+        upper, lower = self.indices(depth_interval)
+        if lower <= upper:
+            raise ValueError(f"The depth interval {depth_interval} spans less than two nodes.")
+        
+        temp_diff = self._gradient_sum(self.temp, upper, lower)
+        z_diff = self._gradient_sum(self.zasl, upper, lower)
+        tc_av = (self.dz_sum[lower+1] - self.dz_sum[upper]) / (self.resistance_sum[lower+1] - self.resistance_sum[upper])
+        
+        hf = - tc_av * (temp_diff/z_diff)
+        if direction==False:
+            hf = np.abs(hf)
+        
+        return hf
+
+    def heat_flow_maps(self, depth_intervals: list, direction: bool=False):
+        """Heat flow maps for many depth intervals, shape (n_intervals, ny, nx)"""
+        return np.stack([self.heat_flow(interval, direction=direction) for interval in depth_intervals])
+
+# each cached structure holds about two volumes, so only the most recently used files are kept
+_INTERVAL_CACHE = OrderedDict()
+_INTERVAL_CACHE_SIZE = 2
+
+def interval_heat_flow(data, model_depth: float=6000.):
+    """Get the IntervalHeatFlow of a result file. The structures of the last two files are cached, keyed by file path and 
+    validated by modification time and size, so evaluating many intervals of one file reuses the prefix sums while looping 
+    over an ensemble of files keeps memory bounded.
+
+    Args:
+        data (str, h5py.File or ShematResult): result file
+        model_depth (float, optional): vertical extent of the model in meter. Defaults to 6000..
+
+    Returns:
+        IntervalHeatFlow: precomputed structure of the result file
+    """
+    with ShematResult(data) as result:
+        filepath = os.path.abspath(result.file.filename)
+        stat = os.stat(filepath)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = _INTERVAL_CACHE.get(filepath)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, IntervalHeatFlow(result, model_depth=model_depth))
+            _INTERVAL_CACHE[filepath] = cached
+        _INTERVAL_CACHE.move_to_end(filepath)
+        while len(_INTERVAL_CACHE) > _INTERVAL_CACHE_SIZE:
+            _INTERVAL_CACHE.popitem(last=False)
+    
+    return cached[1].with_model_depth(model_depth)
+
+def clear_interval_cache():
+    """Release all cached IntervalHeatFlow structures"""
+    _INTERVAL_CACHE.clear()
+
 def calc_cond_hf_over_interval(data: h5py.File, depth_interval:list, model_depth: float=6000., direction: bool=False):
-    """calculate the vertical heatflow over a certain depth interval.
+    """calculate the vertical heatflow over a certain depth interval. Uses the cached IntervalHeatFlow of the file, so 
+    heat flow maps of further intervals of the same file are lookups.
 
     Args:
         data (h5py.File): HDF5 file with simulated variables
@@ -191,61 +421,112 @@ def calc_cond_hf_over_interval(data: h5py.File, depth_interval:list, model_depth
     Returns:
         hf [array]: average heat flow over the defined depth interval
     """
-    zasl = data['z'][:,0,0] - model_depth
-    upper = find_nearest(zasl, depth_interval[0])
-    lower = find_nearest(zasl, depth_interval[1])
-    
-    #temp_diff = data['temp'][upper,:,:] - data['temp'][lower,:,:]
-    temp_diff = np.sum(np.gradient(data['temp'][upper:lower+1,:,:], axis=0),axis=0)
-    tc_av = hmean(data['lz'][upper:lower+1,:,:])
-    #z_diff = zasl[upper] - zasl[lower]
-    z_diff = np.sum(np.gradient(zasl[upper:lower+1], axis=0),axis=0)
-    if direction==True:
-        hf = - tc_av * (temp_diff/z_diff)
-    else:
-        hf = np.abs(-tc_av * (temp_diff/z_diff))
-
-    return hf
+    return interval_heat_flow(data, model_depth=model_depth).heat_flow(depth_interval, direction=direction)
 
-def calc_cond_hf(data: h5py.File, direction: str='full'):
+def calc_cond_hf(data: h5py.File, direction: str='full', chunk_size: int=32, dtype=np.float64, z_range: tuple=None):
     """Calculate the conductive heat flow for the whole model cube in x, y, z direction
 
+    Only the gradients of the requested directions are computed, from the 1D cell sizes of the model. The model is processed 
+    in chunks of z-layers, each read with a halo of one layer, so the result equals np.gradient over the full model while 
+    memory stays bounded by the chunk size.
+
     Args:
-        data (h5py.File): HDF5 file with simulated variables
+        data (h5py.File): HDF5 file with simulated variables, or a ShematResult
         direction (str, optional): string to return either full (x,y,z) heat flow, or just one direction.
                                     x returns just in x-direction, y just in y-direction, z just in z-direction. Defaults to 'full'.
+        chunk_size (int, optional): number of z-layers processed at once. Defaults to 32.
+        dtype (optional): data type of the returned heat flow, e.g. np.float32 to halve the memory. Defaults to np.float64.
+        z_range (tuple, optional): range (k0, k1) of z-layers (upper bound exclusive) the heat flow is calculated for. 
+                                   Defaults to None, i.e. all layers.
 
     Returns:
         [np.ndarray]: array with the heat flow in the specified direction, or the full. then the method returns three variables, 
                         one for each direction.
     """
-    dz = data['delz'][:,:,:]
-    dy = data['dely'][:,:,:]
-    dx = data['delx'][:,:,:]
-    temp_diff = np.gradient(data['temp'][:,:,:])
-    tdx = temp_diff[2]/dx
-    tdy = temp_diff[1]/dy
-    tdz = temp_diff[0]/dz
-    
-    qx = -data['lx'][:,:,:] * tdx
-    qy = -data['ly'][:,:,:] * tdy
-    qz = -data['lz'][:,:,:] * tdz
+    axes = {'x': 2, 'y': 1, 'z': 0}
+    if direction == 'full':
+        directions = ['x', 'y', 'z']
+    elif direction in axes:
+        directions = [direction]
+    else:
+        raise ValueError(f"Unknown direction {direction}, use 'full', 'x', 'y' or 'z'.")
+    
+    with ShematResult(data) as result:
+        nz, ny, nx = result.shape
+        k0, k1 = (0, nz) if z_range is None else z_range
+        spacing = {'x': result.read('delx', np.s_[0, 0, :], copy=True),
+                   'y': result.read('dely', np.s_[0, :, 0], copy=True)[:, None],
+                   'z': result.read('delz', np.s_[:, 0, 0], copy=True)[:, None, None]}
+        q = {d: np.empty((k1 - k0, ny, nx), dtype=dtype) for d in directions}
+        
+        for start in range(k0, k1, chunk_size):
+            stop = min(start + chunk_size, k1)
+            # one layer of halo on each side, so central differences at the chunk borders are exact
+            lower, upper = max(start - 1, 0), min(stop + 1, nz)
+            inner = slice(start - lower, stop - lower)
+            temp = result.subvolume('temp', z=slice(lower, upper))
+            
+            for d in directions:
+                if d == 'z':
+                    tdz = np.gradient(temp, axis=0)[inner] / spacing['z'][start:stop]
+                else:
+                    tdz = np.gradient(temp[inner], axis=axes[d]) / spacing[d]
+                q[d][start - k0:stop - k0] = -result.subvolume('l' + d, z=slice(start, stop)) * tdz
     
     if direction=='full':
-        return qx, qy, qz
-    elif direction=='x':
-        return qx
-    elif direction=='y':
-        return qy
-    elif direction=='z':
-        return qz
-
-def heatcapacity(data: h5py.File):
+        return q['x'], q['y'], q['z']
+    return q[direction]
+
+# coefficients of the rational function approximation of the enthalpy of water (Zyvoloski et al. 1997)
+_ENTHALPY_Y = [0.25623465e-3, 0.10184405e-2, 0.22554970e-4,
+               0.34836663e-7, 0.41769866e-2, -0.21244879e-4,
+               0.25493516e-7, 0.89557885e-4, 0.10855046e-6, -0.21720560e-6]
+_ENTHALPY_Z = [0.10000000e+1, 0.23513278e-1, 0.48716386e-4,
+               -0.19935046e-8, -0.50770309e-2, 0.57780287e-5,
+               0.90972916e-9, -0.58981537e-4, -0.12990752e-7,
+               0.45872518e-8]
+
+def _rational_term(C: list, t: np.ndarray, p: np.ndarray):
+    """Numerator or denominator of the enthalpy approximation and its temperature derivative, in Horner form.
+    The polynomial is written as A0 + t*(A1 + t*(A2 + t*A3)) with coefficients A0..A3 depending on the pressure."""
+    a0 = C[3] * p
+    a0 += C[2]
+    a0 *= p
+    a0 += C[1]
+    a0 *= p
+    a0 += C[0]
+    a1 = C[8] * p
+    a1 += C[7]
+    a1 *= p
+    a1 += C[4]
+    a2 = C[9] * p
+    a2 += C[5]
+    
+    # derivative A1 + t*(2*A2 + 3*A3*t)
+    deriv = (3.0 * C[6]) * t
+    deriv += 2.0 * a2
+    deriv *= t
+    deriv += a1
+    
+    value = C[6] * t
+    value += a2
+    value *= t
+    value += a1
+    value *= t
+    value += a0
+    
+    return value, deriv
+
+def heatcapacity(data: h5py.File, chunk_size: int=32, dtype=np.float64):
     """Calculate the specific, isobaric heat capacity of water based on Zyvoloski 1997.
 
+    The temperature and pressure fields are processed in chunks of z-layers read straight from the HDF5 file, and the rational 
+    function is evaluated in Horner form with in-place operations, so only a few temporary arrays of chunk size are needed.
 
     Args:
-        data (h5py.File): HDF5 file with the heat transport simulation
+        data (h5py.File): HDF5 file with the heat transport simulation, or a ShematResult
+        chunk_size (int, optional): number of z-layers processed at once. Defaults to 32.
+        dtype (optional): data type of the calculation and result, e.g. np.float32 for half the memory. Defaults to np.float64.
 
     Returns:
         cpf: 3D array of the specific heat capacity of water
@@ -255,56 +536,103 @@ def heatcapacity(data: h5py.File):
     finite-element heat- and mass-transfer code. United
     States. doi:10.2172/565545.
     """
-    Y = [0.25623465e-3, 0.10184405e-2, 0.22554970e-4,
-         0.34836663e-7, 0.41769866e-2, -0.21244879e-4,
-         0.25493516e-7, 0.89557885e-4, 0.10855046e-6, -0.21720560e-6]
-    Z = [0.10000000e+1, 0.23513278e-1, 0.48716386e-4,
-         -0.19935046e-8, -0.50770309e-2, 0.57780287e-5,
-         0.90972916e-9, -0.58981537e-4, -0.12990752e-7,
-         0.45872518e-8]
-    
-    t = data['temp'][:,:,:]
-    p = data['pres'][:,:,:] * 1e-6
-    
-    p2 = p*p
-    p3 = p2*p
-    p4 = p3*p
-    t2 = t*t
-    t3 = t2*t
-    tp = p*t
-    tp2 = t*p2
-    t2p = t2*p
-    
-    #Numerator of rational function approximation
-    ta = Y[0] + Y[1]*p + Y[2]*p2 + Y[3]*p3 + Y[4]*t \
-        + Y[5]*t2 + Y[6]*t3 + Y[7]*tp + Y[8]*tp2 + Y[9]*t2p
-
-    #Denominator of rational function approximation
-    tb = Z[0] + Z[1]*p + Z[2]*p2 + Z[3]*p3 + Z[4]*t \
-        + Z[5]*t2 + Z[6]*t3 + Z[7]*tp + Z[8]*tp2 + Z[9]*t2p
-
-    #Enthalpy
-    enth = ta/tb
-
-    #Derivative of numerator
-    da = Y[4] + 2.0*Y[5]*t + 3.0*Y[6]*t2 + Y[7]*p \
-        + Y[8]*p2 + 2.0*Y[9]*tp
-
-    #Derivative of denominator
-    db = Z[4] + 2.0*Z[5]*t + 3.0*Z[6]*t2 + Z[7]*p \
-        + Z[8]*p2 + 2.0*Z[9]*tp
-
-    #Denominator squared
-    b2 = tb*tb
-
-    #Derivative, quotient rule
-    denthdt = da/tb - ta*db/b2
-
-    #Isobaric heat capacity (J/kg/K)
-    cpf = denthdt*1.0e6
+    with ShematResult(data) as result:
+        nz, ny, nx = result.shape
+        cpf = np.empty((nz, ny, nx), dtype=dtype)
+        
+        for start in range(0, nz, chunk_size):
+            stop = min(start + chunk_size, nz)
+            t = result.subvolume('temp', z=slice(start, stop)).astype(dtype)
+            p = result.subvolume('pres', z=slice(start, stop)).astype(dtype)
+            p *= 1e-6
+            
+            #Numerator and denominator of rational function approximation, with derivatives
+            ta, da = _rational_term(_ENTHALPY_Y, t, p)
+            tb, db = _rational_term(_ENTHALPY_Z, t, p)
+            
+            #Derivative, quotient rule (da*tb - ta*db)/tb^2
+            da *= tb
+            ta *= db
+            da -= ta
+            tb *= tb
+            da /= tb
+            
+            #Isobaric heat capacity (J/kg/K)
+            np.multiply(da, 1.0e6, out=cpf[start:stop])
     
     return cpf
 
+def _read_field_chunk(filepath: str, field, z_range: tuple):
+    """Read the layers z_range of a field, or evaluate a derived field on them"""
+    with ShematResult(filepath) as result:
+        if callable(field):
+            return np.asarray(field(result, z_range))
+        return result.subvolume(field, z=slice(*z_range), copy=True)
+
+def _welford_update(values: np.ndarray, z_range: tuple, count: int, mean, m2, minimum, maximum):
+    """Fold one chunk of one file into the running statistics, returns the new count of the chunk"""
+    layers = slice(*z_range)
+    count += 1
+    delta = values - mean[layers]
+    mean[layers] += delta / count
+    delta *= values - mean[layers]
+    m2[layers] += delta
+    np.minimum(minimum[layers], values, out=minimum[layers])
+    np.maximum(maximum[layers], values, out=maximum[layers])
+    
+    return count
+
+def ensemble_statistics(files: list, field='temp', chunk_size: int=32, n_workers: int=4, ddof: int=0, dtype=np.float64):
+    """Mean, variance, minimum and maximum of a field over an ensemble of SHEMAT-Suite result files, in a single streaming pass.
+
+    Files are read chunk by chunk (z-layers) by a pool of threads and folded into running statistics with Welford updates, 
+    so memory does not grow with the number of files: besides the statistics, only a few chunks are held at a time.
+
+    Args:
+        files (list): paths of the result files
+        field (str or callable, optional): name of the field, or a function field(result, z_range) returning a derived quantity 
+                                           for the z-layers z_range=(k0, k1) of a ShematResult, e.g. 
+                                           `lambda result, z_range: calc_cond_hf(result, 'z', z_range=z_range)`. Defaults to 'temp'.
+        chunk_size (int, optional): number of z-layers read at once. Defaults to 32.
+        n_workers (int, optional): number of threads reading files. Defaults to 4.
+        ddof (int, optional): delta degrees of freedom of the variance, as in np.var. Defaults to 0.
+        dtype (optional): data type of the statistics. Defaults to np.float64.
+
+    Returns:
+        dict: 'mean', 'var', 'std', 'min' and 'max' of shape (nz, ny, nx), and the number of files 'n'
+    """
+    if len(files) == 0:
+        raise ValueError("No result files given.")
+    with ShematResult(files[0]) as result:
+        nz, ny, nx = result.shape
+    
+    mean = np.zeros((nz, ny, nx), dtype=dtype)
+    m2 = np.zeros((nz, ny, nx), dtype=dtype)
+    minimum = np.full((nz, ny, nx), np.inf, dtype=dtype)
+    maximum = np.full((nz, ny, nx), -np.inf, dtype=dtype)
+    
+    chunks = [(start, min(start + chunk_size, nz)) for start in range(0, nz, chunk_size)]
+    tasks = [(filepath, z_range) for filepath in files for z_range in chunks]
+    counts = {z_range: 0 for z_range in chunks}
+    
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        # a bounded number of reads in flight keeps memory independent of the ensemble size
+        pending = deque()
+        for task in tasks:
+            pending.append((task[1], pool.submit(_read_field_chunk, task[0], field, task[1])))
+            if len(pending) < 2 * n_workers:
+                continue
+            z_range, future = pending.popleft()
+            counts[z_range] = _welford_update(future.result(), z_range, counts[z_range], mean, m2, minimum, maximum)
+        while pending:
+            z_range, future = pending.popleft()
+            counts[z_range] = _welford_update(future.result(), z_range, counts[z_range], mean, m2, minimum, maximum)
+    
+    n = len(files)
+    var = m2 / (n - ddof) if n > ddof else np.full_like(m2, np.nan)
+    
+    return {'mean': mean, 'var': var, 'std': np.sqrt(var), 'min': minimum, 'max': maximum, 'n': n}
+
 def calc_adv_hf(data: h5py.File, direction: str='full'):
     """Calculate advective heat flow"""
     print("Coming soon(tm)")
@@ -515,30 +843,22 @@ def extract_parameters(datafile, parameters: list=['temp','uindex'], dimension:
         [type]: [description]
     """
     param_dict = {}
-    if type(datafile)==str:
-        f = read_hdf_file(datafile)
-    else:
-        f = datafile
-    
-    z, y, x = f['temp'].shape
-    param_dict['x'] = f['x'][0,0,:]
-    param_dict['y'] = f['y'][0,:,0]
-    param_dict['z'] = f['z'][:,0,0]
-    
-    
-    if dimension==3:
-        for i in parameters:
-            param_dict[i] = f[i][:,:,:]
-    elif dimension==2:
-        if direction=='x':
-            for i in parameters:
-                param_dict[i] = f[i][:,:,x//2]
-        elif direction=='y':
-            for i in parameters:
-                param_dict[i] = f[i][:,y//2,:]
-        elif direction=='z':
+    with ShematResult(datafile) as result:
+        z, y, x = result.shape
+        param_dict['x'] = result.x
+        param_dict['y'] = result.y
+        param_dict['z'] = result.z
+        
+        
+        if dimension==3:
             for i in parameters:
-                param_dict[i] = f[i][z//2,:,:]
+                param_dict[i] = result[i]
+        elif dimension==2:
+            middle = {'x': x//2, 'y': y//2, 'z': z//2}
+            if direction in middle:
+                for i in parameters:
+                    param_dict[i] = result.slice(i, direction, middle[direction], copy=True)
+    
     return param_dict
 
 def calc_tgradient(data, direction=True):
@@ -551,10 +871,11 @@ def calc_tgradient(data, direction=True):
     Returns:
         gradT (np.array): array of the temperature gradient
     """
-    temp = data['temp'][:,:,:]
-    z = data['z'][:,0,0]
+    with ShematResult(data) as result:
+        temp = result['temp']
+        z = result.z
     
-    gradT = -np.gradient(temp)[0]/np.gradient(z)
+    gradT = -np.gradient(temp, axis=0)/np.gradient(z)[:,None,None]
     
     if direction==False:
         gradT = np.abs(gradT)
@@ -9,8 +9,14 @@ Methods comprise masking the geological model with topography and calculation of
 # Libraries
 import os,sys
 import glob
+import fnmatch
+import json
+import hashlib
+import mmap
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import itertools as it
+import h5py
 import gempy as gp
 import pandas as pd
 
@@ -54,71 +60,409 @@ def topomask(geo_model, lith_block):
     
     return mask_lith
 
-def conc_lithblocks(path: str='.'):
-    """Concatenate multiple lith block files (npy files) in a folder into one numpy array
+def topomask_ensemble(geo_model, lith_blocks, out: np.ndarray=None, chunk_size: int=64):
+    """Mask all lith blocks of an ensemble with the model topography. The air cells are determined once 
+    for the whole ensemble and the air ID is taken from the surfaces table (highest surface ID + 1), 
+    so no temporary arrays are created per realization.
+
+    Args:
+        geo_model (gp model): gempy geomodel
+        lith_blocks (np.array): lith blocks of the ensemble, shape (n_realizations, n_cells)
+        out (np.ndarray, optional): preallocated output array of the same shape. Pass lith_blocks itself to mask in place. 
+                                    Defaults to None, i.e. a new integer array is allocated.
+        chunk_size (int, optional): number of realizations processed at once. Defaults to 64.
+
+    Returns:
+        np.array: lith blocks with rounded IDs, masked with topography, shape (n_realizations, n_cells)
+    """
+    topo_mask = geo_model._grid.regular_grid.mask_topo
+    air_cells = np.flatnonzero(topo_mask)
+    air_id = geo_model.surfaces.df['id'].max() + 1
+    
+    if out is None:
+        out = np.empty(np.shape(lith_blocks), dtype=int)
+    
+    for i in range(0, len(lith_blocks), chunk_size):
+        block = out[i:i+chunk_size]
+        np.rint(lith_blocks[i:i+chunk_size], out=block, casting='unsafe')
+        block[:, air_cells] = air_id
+    
+    return out
+
+def format_records(records: np.ndarray, fmt: str):
+    """Format a 2D array row by row with a printf-style format string, producing the same text as `np.savetxt`,
+    but in a single string formatting operation instead of one per row.
+
+    Args:
+        records (np.ndarray): 2D array of records, one row per record
+        fmt (str): format of a single row, e.g. '%d, %d, %d, %.3f, %d'
+
+    Returns:
+        str: formatted records, each terminated by a newline
+    """
+    records = np.asarray(records)
+    if len(records) == 0:
+        return ""
+    
+    return ("\n".join([fmt] * len(records)) + "\n") % tuple(records.ravel().tolist())
+
+def topography_bcs(geo_model, lith_block, dtm: np.ndarray, lapse_rate: float=0.0065, sea_temp: float=288.,
+                   head_offset: float=6500., air_id: int=None, head_file: str=None, temp_file: str=None):
+    """Create top boundary conditions for head and temperature from the topography. Every air cell of the
+    topography-masked lith block gets the elevation of the topography (plus head_offset) as head and 
+    the surface temperature estimated with an average lapse rate as temperature. As the air cells depend 
+    on the realization, this can be called per lith block.
+
+    Args:
+        geo_model (gp model): gempy model
+        lith_block (np.array): lith block masked with topography, see topomask
+        dtm (np.ndarray): topography in the resolution of the regular grid, shape (nx, ny, 3) with x, y, z
+        lapse_rate (float, optional): temperature lapse rate in Kelvin per metre. Defaults to 0.0065.
+        sea_temp (float, optional): temperature at sea level in Kelvin. Defaults to 288.
+        head_offset (float, optional): height of the model below sea level, added to the head. Defaults to 6500.
+        air_id (int, optional): unit ID of the air. Defaults to None, i.e. highest surface ID + 1.
+        head_file (str, optional): file the head boundary conditions are written to. Defaults to None.
+        temp_file (str, optional): file the temperature boundary conditions are written to. Defaults to None.
+
+    Returns:
+        tuple: (head_bcs, temp_bcs) arrays with the columns i, j, k (Fortran indices, starting at 1), value, direction
+    """
+    resolution = get_grid_metadata(geo_model)['resolution']
+    if air_id is None:
+        air_id = geo_model.surfaces.df['id'].max() + 1
+    
+    liths = np.round(lith_block).astype(int).reshape(resolution)
+    i, j, k = np.nonzero(liths == air_id)
+    
+    elevation = dtm[:,:,2]
+    surf_temp = (sea_temp - lapse_rate * elevation) - 273.15 # in Celsius
+    
+    # Fortran indices start at 1, SHEMAT requires a direction column
+    ijk = np.stack([i + 1, j + 1, k + 1], axis=1)
+    direction = np.zeros((len(ijk), 1))
+    head_bcs = np.hstack([ijk, (elevation[i, j] + head_offset).reshape(-1,1), direction])
+    temp_bcs = np.hstack([ijk, surf_temp[i, j].reshape(-1,1), direction])
+    
+    if head_file is not None:
+        with open(head_file, 'w') as file:
+            file.write(format_records(head_bcs, '%d, %d, %d, %.3f, %d'))
+    if temp_file is not None:
+        with open(temp_file, 'w') as file:
+            file.write(format_records(temp_bcs, '%d, %d, %d, %.3f, %d'))
+    
+    return head_bcs, temp_bcs
+
+def basal_heat_flow_bcs(geo_model, heat_flow, hf_file: str=None):
+    """Create a spatially varying basal heat flow boundary condition, to be used as `hf_bcs_file` of the 
+    SHEMAT-Suite export. The file contains one value per basal cell, with i varying fastest (Fortran order).
+
+    Args:
+        geo_model (gp model): gempy model
+        heat_flow (float, np.ndarray or callable): basal heat flow in W/m². Either a single value, an array of shape (nx, ny),
+                                                   or a function of the cell center coordinates f(x, y) returning the heat flow.
+        hf_file (str, optional): file the heat flow values are written to. Defaults to None.
+
+    Returns:
+        np.ndarray: basal heat flow of shape (nx, ny)
+    """
+    grid = get_grid_metadata(geo_model)
+    nx, ny, nz = grid['resolution']
+    delx, dely, delz = grid['spacing']
+    xmin, xmax, ymin, ymax, zmin, zmax = grid['extent']
+    
+    if callable(heat_flow):
+        x = xmin + (np.arange(nx) + 0.5) * delx
+        y = ymin + (np.arange(ny) + 0.5) * dely
+        xx, yy = np.meshgrid(x, y, indexing='ij')
+        hf = np.asarray(heat_flow(xx, yy), dtype=float)
+    else:
+        hf = np.broadcast_to(np.asarray(heat_flow, dtype=float), (nx, ny))
+    if hf.shape != (nx, ny):
+        raise ValueError(f"Basal heat flow has shape {hf.shape}, expected {(nx, ny)}.")
+    
+    if hf_file is not None:
+        with open(hf_file, 'w') as file:
+            file.write(format_records(hf.reshape(-1, 1, order='F'), '%.6g'))
+    
+    return np.array(hf)
+
+def conc_lithblocks(path: str='.', out_file: str=None):
+    """Concatenate multiple lith block files (npy files) in a folder into one numpy array. 
+    Files are read in sorted order. The output is allocated once from the shapes in the npy headers 
+    and filled from memory-mapped sources, so optionally writing it to a memory-mapped npy file 
+    allows assembling ensembles larger than the memory.
 
     Args:
         path (str, optional): Path to the numpy array files. Defaults to '.'.
+        out_file (str, optional): npy file the concatenated lith blocks are written to as memory map, must not match 
+                                  the lith block files in path, which later calls would read again. 
+                                  Defaults to None, i.e. the result is kept in memory.
 
     Returns:
-        np.array: concatenated lith blocks in a numpy array
+        np.array: concatenated lith blocks in a numpy array (np.memmap if out_file is given)
     """
-    fids = glob.glob(path+'*.npy')
-    lith_blocks = []
+    pattern = path+'*.npy'
+    if out_file is not None:
+        out_path = os.path.abspath(out_file)
+        if (os.path.dirname(out_path) == os.path.abspath(os.path.dirname(pattern)) 
+                and fnmatch.fnmatch(os.path.basename(out_path), os.path.basename(pattern))):
+            raise ValueError(f"out_file {out_file} matches the lith block files {pattern}, write it to another folder.")
+    
+    fids = sorted(glob.glob(pattern))
+    if len(fids) == 0:
+        raise FileNotFoundError(f"No npy files found in {path}.")
     
+    # memory mapping only reads the npy headers here
+    shapes = []
+    dtypes = []
     for f in fids:
-        blocks = np.load(f)
-        lith_blocks.append(blocks)
-        all_lith_blocks = np.concatenate(lith_blocks)
+        blocks = np.load(f, mmap_mode='r')
+        shapes.append(blocks.shape)
+        dtypes.append(blocks.dtype)
+        del blocks
+    
+    if any(shape[1:] != shapes[0][1:] for shape in shapes):
+        raise ValueError("Lith block files have incompatible shapes and can not be concatenated.")
+    shape = (sum(shape[0] for shape in shapes),) + shapes[0][1:]
+    dtype = np.result_type(*dtypes)
+    
+    if out_file is None:
+        all_lith_blocks = np.empty(shape, dtype=dtype)
+    else:
+        all_lith_blocks = np.lib.format.open_memmap(out_file, mode='w+', dtype=dtype, shape=shape)
+    
+    start = 0
+    for f, f_shape in zip(fids, shapes):
+        blocks = np.load(f, mmap_mode='r')
+        all_lith_blocks[start:start+f_shape[0]] = blocks
+        start += f_shape[0]
+        del blocks
+    
+    if out_file is not None:
+        all_lith_blocks.flush()
         
     return all_lith_blocks
 
-def export_shemat_suite_input_file(geo_model, lithology_block, output: str="vtk hdf",
-                                   units: pd.DataFrame=None, head_bcs_file: str=None, 
-                                   top_temp_bcs_file: str=None, hf_bcs_file: str=None, 
-                                   hf_value: float=0.07, conduction_only: bool=True,
-                                   data_file: str=None, borehole_logs: np.array=None,
-                                   lateral_boundaries: str='closed',
-                                   path: str=None, filename: str='geo_model_SHEMAT_input_erode'):
-    """Method to export a 3D geological model as SHEMAT-Suite input-file for a conductive HT-simulation. 
+def rle_encode(ids: np.ndarray):
+    """Run-length encode a 1D array of unit IDs.
 
     Args:
-        geo_model (gp model): gempy model
-        lithology_block (numpy array): array containing the lithology IDs for the regular grid of the model
-        output (str, optional): declare which output files should be generated hdf=HDF5, vtk=VTK, plt=PLT (tecplot)
-        units (pd.DataFrame, optional): unit petrophysical parameters for SHEMAT-Suite model. Defaults to None.
-        head_bcs_file (str, optional): boundary condition file for spatially varying boundary conditions (e.g. head by topography). Defaults to None.
-        top_temp_bcs_file (str, optional): boundary condition file for spatially varying boundary conditions (e.g. temperature due to topography). Defaults to None.
-        data_file (str, optional): data for calibrating the model, e.g. temperatures from boreholes. Defaults to None.
-        borehole_logs (np.array, optional): coordinates for synthetic borehole logs, will write parameters such as pressure and temperature. Defaults to None.
-        lateral_boundaries (str, optional): Lateral BCs. Defaults to 'closed'.
-        path (str, optional): save path for the SHEMAT-Suite input file. Defaults to None.
-        filename (str, optional): name of the SHEMAt-Suite input file. Defaults to 'geo_model_SHEMAT_input_erode'.
+        ids (np.ndarray): 1D array of integer unit IDs, already in the order SHEMAT-Suite expects (Fortran order)
+
+    Returns:
+        tuple: (counts, values), the length of each run and the unit ID of each run
+    """
+    ids = np.asarray(ids).ravel()
+    if ids.size == 0:
+        return np.array([], dtype=int), ids[:0]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+    counts = np.diff(np.append(starts, ids.size))
+    
+    return counts, ids[starts]
+
+def format_uindex(ids: np.ndarray):
+    """Format unit IDs as the run-length encoded `# uindex` block of a SHEMAT-Suite input file,
+    i.e. space separated `count*id` pairs.
+
+    Args:
+        ids (np.ndarray): 1D array of integer unit IDs in Fortran order
+
+    Returns:
+        str: the uindex block
+    """
+    counts, values = rle_encode(ids)
+    
+    return _format_runs(counts, values)
+
+def _format_runs(counts, values):
+    pairs = np.column_stack((counts, values)).ravel().tolist()
+    
+    return " ".join(["%d*%d"] * len(counts)) % tuple(pairs)
+
+def write_uindex(file, lithology_block, resolution, chunk_size: int=2**20):
+    """Stream the run-length encoded `# uindex` block of a lith block to an open file. The block is 
+    rounded, encoded and written in chunks of z-layers, runs crossing chunk borders are merged, so 
+    the output is identical to format_uindex while memory stays bounded by the chunk size.
+
+    Args:
+        file (file object): file opened for writing
+        lithology_block (np.array): lith block of a gempy model, flattened in the regular grid
+        resolution (tuple): model resolution (nx, ny, nz)
+        chunk_size (int, optional): approximate number of cells encoded at once. Defaults to 2**20.
+    """
+    nx, ny, nz = resolution
+    ids = np.asarray(lithology_block).reshape((nx, ny, nz))
+    layers = max(1, chunk_size // (nx*ny))
+    
+    pending = None
+    separator = ""
+    for k in range(0, nz, layers):
+        # z is the slowest index in Fortran order, so each chunk is a contiguous part of the uindex sequence
+        chunk = np.round(ids[:, :, k:k+layers]).astype(int).flatten('F')
+        counts, values = rle_encode(chunk)
+        if pending is not None:
+            if values[0] == pending[1]:
+                counts[0] += pending[0]
+            else:
+                counts = np.insert(counts, 0, pending[0])
+                values = np.insert(values, 0, pending[1])
+        # the last run may continue in the next chunk
+        pending = (counts[-1], values[-1])
+        if len(counts) > 1:
+            file.write(separator + _format_runs(counts[:-1], values[:-1]))
+            separator = " "
+    
+    if pending is not None:
+        file.write(separator + "%d*%d" % pending)
+
+# cache of boundary condition and data files, {absolute path: ((mtime, size), text, number of lines)}. The files written 
+# for each model (remapped, regional or profile boundary conditions) pass through it as well, so only the most recently 
+# used files are kept; the shared input files are read for every export and stay in it.
+_BC_FILE_CACHE = OrderedDict()
+_BC_FILE_CACHE_SIZE = 16
+
+def read_bc_file(filepath: str):
+    """Read a boundary condition (or data) file and count its records in a single pass. 
+    Content and record count of the most recently used files are cached per path, and re-read 
+    if the modification time or size of the file changed.
+
+    Args:
+        filepath (str): path to the boundary condition file
+
+    Returns:
+        tuple: (text, lines), content of the file and its number of lines
+    """
+    key = os.path.abspath(filepath)
+    stat = os.stat(key)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    
+    cached = _BC_FILE_CACHE.get(key)
+    if cached is not None and cached[0] == signature:
+        _BC_FILE_CACHE.move_to_end(key)
+        return cached[1], cached[2]
+    
+    with open(key, 'r') as file:
+        text = file.read()
+    lines = text.count('\n')
+    if text and not text.endswith('\n'):
+        lines += 1
+    
+    _BC_FILE_CACHE[key] = (signature, text, lines)
+    _BC_FILE_CACHE.move_to_end(key)
+    while len(_BC_FILE_CACHE) > _BC_FILE_CACHE_SIZE:
+        _BC_FILE_CACHE.popitem(last=False)
+    
+    return text, lines
+
+def clear_bc_cache():
+    """Empty the cache of boundary condition files used by read_bc_file."""
+    _BC_FILE_CACHE.clear()
+
+def format_units(units: pd.DataFrame, default: bool=False):
+    """Format a units table as the `# units` block of a SHEMAT-Suite input file, one line per unit.
+
+    Args:
+        units (pd.DataFrame): unit petrophysical parameters with the columns 'surface', 'por', 'perm' and 'lz'
+        default (bool, optional): ignore the parameters of the table and use default values, only 'surface' is required. Defaults to False.
+
+    Returns:
+        str: the units block
     """
+    surfaces = units['surface'].tolist()
+    if default:
+        line = "0.01d0    1.d0  1.d0  1.e-14\t 1.e-10  1.d0  1.d0  3.74\t0.  2077074.  10  2e-3\t!%s \n"
+        return "".join([line] * len(surfaces)) % tuple(surfaces)
+    
+    missing = [c for c in ['por', 'perm', 'lz'] if c not in units.columns]
+    if missing:
+        raise KeyError(f"Units table is missing the columns {missing}.")
+    
+    line = "%s    1.d0  1.d0  %s\t 1.e-10  1.d0  1.d0  %s\t0.  2077074.  10  2e-3\t!%s \n"
+    rows = zip(units['por'].tolist(), units['perm'].tolist(), units['lz'].tolist(), surfaces)
+    
+    return "".join([line] * len(surfaces)) % tuple(value for row in rows for value in row)
 
-    # get model dimensions
+def sample_unit_parameters(units: pd.DataFrame, n_realizations: int, distributions: dict, seed: int=None):
+    """Sample petrophysical parameters of the units for an ensemble of models, e.g. for petrophysical uncertainty runs.
+
+    Args:
+        units (pd.DataFrame): units table with the columns 'surface', 'por', 'perm' and 'lz'
+        n_realizations (int): number of realizations
+        distributions (dict): distributions per parameter and surface, as scipy.stats frozen distributions, e.g. 
+                              {'lz': {'Mesozoic': stats.norm(4.64, 0.3)}, 'perm': {'Tertiary': stats.loguniform(1e-15, 1e-13)}}.
+                              Parameters of units without distribution are kept.
+        seed (int, optional): seed of the random number generator. Defaults to None.
+
+    Returns:
+        list: units tables, one per realization
+    """
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for parameter, unit_distributions in distributions.items():
+        values = np.tile(units[parameter].values.astype(float), (n_realizations, 1))
+        for surface, distribution in unit_distributions.items():
+            idx = np.flatnonzero(units['surface'].to_numpy() == surface)
+            if idx.size == 0:
+                raise KeyError(f"Surface {surface} not found in the units table.")
+            values[:, idx[0]] = distribution.rvs(size=n_realizations, random_state=rng)
+        samples[parameter] = values
+    
+    units_ensemble = []
+    for i in range(n_realizations):
+        realization = units.copy()
+        for parameter, values in samples.items():
+            realization[parameter] = values[i]
+        units_ensemble.append(realization)
+    
+    return units_ensemble
+
+def get_grid_metadata(geo_model):
+    """Collect the regular grid information of a gempy model needed for a SHEMAT-Suite input file.
+
+    Args:
+        geo_model (gp model): gempy model
+
+    Returns:
+        dict: resolution (nx, ny, nz), extent and cell sizes (delx, dely, delz) of the regular grid
+    """
     nx, ny, nz = geo_model.grid.regular_grid.resolution
     xmin, xmax, ymin, ymax, zmin, zmax = geo_model.solutions.grid.regular_grid.extent
     
-    delx = (xmax - xmin)/nx
-    dely = (ymax - ymin)/ny
-    delz = (zmax - zmin)/nz
-    
-    # get unit IDs and restructure them
-    #ids = np.round(geo_model.solutions.lith_block)
-    #ids = ids.astype(int)
-    ids = np.round(lithology_block)
-    ids = ids.astype(int)
+    grid = {'resolution': (nx, ny, nz),
+            'extent': (xmin, xmax, ymin, ymax, zmin, zmax),
+            'spacing': ((xmax - xmin)/nx, (ymax - ymin)/ny, (zmax - zmin)/nz)}
     
-    liths = ids.reshape((nx, ny, nz))
-    liths = liths.flatten('F')
+    return grid
 
-    # group litho in space-saving way
-    sequence = [len(list(group)) for key, group in it.groupby(liths)]
-    unit_id = [key for key, group in it.groupby(liths)]
-    combined = ["%s*%s" % (pair) for pair in zip(sequence,unit_id)]
+def shemat_input_sections(geo_model, output: str="vtk hdf",
+                          units: pd.DataFrame=None, head_bcs_file: str=None, 
+                          top_temp_bcs_file: str=None, hf_bcs_file: str=None, 
+                          hf_value: float=0.07, conduction_only: bool=True,
+                          data_file: str=None, borehole_logs: np.array=None,
+                          lateral_boundaries: str='closed', individual_init: bool=False, grid: dict=None,
+                          lateral_temp_bcs_file: str=None):
+    """Build the parts of a SHEMAT-Suite input file which do not depend on the lithology of a realization.
+    The file is assembled as info + title + setup + units + boundaries + uindex block.
 
-    combined_string = " ".join(combined)
+    Args:
+        grid (dict, optional): grid of the exported model, see get_grid_metadata. Defaults to None, i.e. the regular grid of geo_model.
+        lateral_temp_bcs_file (str, optional): fixed temperatures at the lateral boundaries, e.g. from regional_boundary_temperatures. 
+                                               Defaults to None.
+        for all other arguments, see export_shemat_suite_input_file
+
+    Returns:
+        dict: text of the sections 'info', 'setup', 'units' and 'boundaries'
+    """
+    if grid is None:
+        grid = get_grid_metadata(geo_model)
+    nx, ny, nz = grid['resolution']
+    delx, dely, delz = grid['spacing']
+
+    # initial values, a {title} placeholder is replaced by the file name when writing
+    if individual_init:
+        init_prefix = "{title}_"
+    else:
+        init_prefix = ""
 
     # heat transport
     if conduction_only==True:
@@ -128,35 +472,26 @@ def export_shemat_suite_input_file(geo_model, lithology_block, output: str="vtk
     
     # bcs
     if head_bcs_file is not None:
-        with open(head_bcs_file, 'r') as file:
-            bc_vals = file.read()
-            file.seek(0)
-            lines = len(file.readlines())
-            head_bcs = f"# head bcd, records={lines}\n{bc_vals}"
+        bc_vals, lines = read_bc_file(head_bcs_file)
+        head_bcs = f"# head bcd, records={lines}\n{bc_vals}"
     else:
         head_bcs = f"# head bcd, simple=top, error=ignore\n{nx*ny}*{nz*delz}"
         
     if top_temp_bcs_file is not None:
-        with open(top_temp_bcs_file, 'r') as file:
-            bc_vals_tt = file.read()
-            file.seek(0)
-            lines = len(file.readlines())
-            temp_t_bcs = f"# temp bcd, records={lines}\n{bc_vals_tt}"
+        bc_vals_tt, lines = read_bc_file(top_temp_bcs_file)
+        temp_t_bcs = f"# temp bcd, records={lines}\n{bc_vals_tt}"
     else:
         temp_t_bcs = f"# temp bcd, simple=top, error=ignore, value=init"
 
     if hf_bcs_file is not None:
-        with open(hf_bcs_file, 'r') as file:
-            bc_vals_t = file.read()
-            file.seek(0)
-            lines = len(file.readlines())
-            #temp_bcs = f"# temp bcn, records={lines}\n{bc_vals_t}"
-            temp_bcs = f"# temp bcn, simple=base, error=ignore\n{bc_vals_t}"
+        bc_vals_t, lines = read_bc_file(hf_bcs_file)
+        #temp_bcs = f"# temp bcn, records={lines}\n{bc_vals_t}"
+        temp_bcs = f"# temp bcn, simple=base, error=ignore\n{bc_vals_t}"
     else:
         temp_bcs = f"# temp bcn, simple=base, error=ignore\n{nx*ny}*{hf_value}"
     
     # borehole logs
-    if borehole_logs is not None:
+    if borehole_logs is not None and len(borehole_logs) > 0:
         n_logs = len(borehole_logs)
         borehole_string = f"# borehole logs, records={n_logs} \n"
         for hole in range(n_logs):
@@ -173,34 +508,31 @@ def export_shemat_suite_input_file(geo_model, lithology_block, output: str="vtk
         # head bcd, simple=front, error=ignore, value=init\n
         # temp bcd, simple=front, error=ignore, value=init\n"""
     else:
-        raise(f"Unknown lateral boundaries condition: {lateral_boundaries}.") 
+        raise ValueError(f"Unknown lateral boundaries condition: {lateral_boundaries}.") 
+    if lateral_temp_bcs_file is not None:
+        bc_vals_lat, lines = read_bc_file(lateral_temp_bcs_file)
+        lat_bcs += f"\n\n# temp bcd, records={lines}\n{bc_vals_lat}"
 
         
     if data_file is None:
         data_string = "!# data, records=0"
     else:
-        with open(data_file, 'r') as file:
-            data_vals = file.read()
-            file.seek(0)
-            data_lines = len(file.readlines())
+        data_vals, data_lines = read_bc_file(data_file)
         data_string = f"\n# data, records={data_lines-1}  !"
         data_string += data_vals
     # units
-    unitstring = ""
-    try:
-        for index, rows in units.iterrows():
-            unitstring += f"{rows['por']}    1.d0  1.d0  {rows['perm']}	 1.e-10  1.d0  1.d0  {rows['lz']}	0.  2077074.  10  2e-3	!{rows['surface']} \n" 	
-    except:
+    if units is None:
         print("No units table found, filling in default values for petrophysical properties.")
-        # get number of units and set units string
-        units = geo_model.surfaces.df[['surface', 'id']]
-        for index, rows in units.iterrows():
-            unitstring += f"0.01d0    1.d0  1.d0  1.e-14	 1.e-10  1.d0  1.d0  3.74	0.  2077074.  10  2e-3	!{rows['surface']} \n" 	
+        unitstring = format_units(geo_model.surfaces.df[['surface', 'id']], default=True)
+    else:
+        unitstring = format_units(units)
         
-    # input file as f-string
-    fstring = f"""!==========>>>>> INFO
+    # input file sections as f-strings, the title is inserted between info and setup
+    info = """!==========>>>>> INFO
 # Title
-{filename}
+"""
+
+    setup = f"""
 
 # linfo
 1 2 1 1
@@ -270,14 +602,16 @@ def export_shemat_suite_input_file(geo_model, lithology_block, output: str="vtk
 1.0d-2 1.0
 
 !==========>>>>> INITIAL VALUES
-# temp init HDF5=temp_init.h5
+# temp init HDF5={init_prefix}temp_init.h5
 
-# head init HDF5=head_init.h5
+# head init HDF5={init_prefix}head_init.h5
 
 !==========>>>>> UNIT DESCRIPTION
 !!
 # units
-{unitstring}
+"""
+
+    boundaries = f"""
 
 !==========>>>>>   define boundary properties
 {temp_t_bcs}
@@ -291,16 +625,1022 @@ def export_shemat_suite_input_file(geo_model, lithology_block, output: str="vtk
 {data_string}
 
 # uindex
-{combined_string}"""
+"""
+
+    return {'info': info, 'setup': setup, 'units': unitstring, 'boundaries': boundaries}
+
+def write_shemat_input(sections: dict, lithology_block, resolution: tuple, path: str, filename: str,
+                       chunk_size: int=2**20):
+    """Write a SHEMAT-Suite input file section by section to a buffered file, followed by the 
+    uindex block streamed in chunks (see write_uindex). The file is never assembled in memory.
+
+    Args:
+        sections (dict): sections of the input file, as returned by shemat_input_sections
+        lithology_block (np.array): lith block of a gempy model, flattened in the regular grid
+        resolution (tuple): model resolution (nx, ny, nz)
+        path (str): save path for the SHEMAT-Suite input file
+        filename (str): name of the SHEMAT-Suite input file, also used as title
+        chunk_size (int, optional): approximate number of cells encoded at once. Defaults to 2**20.
+    """
+    with open(path+filename, 'w+', buffering=2**20) as f:
+        f.write(sections['info'])
+        f.write(filename)
+        f.write(sections['setup'].replace('{title}', filename))
+        f.write(sections['units'])
+        f.write(sections['boundaries'])
+        write_uindex(f, lithology_block, resolution, chunk_size)
+
+def cell_map_from_axes(i_map, j_map, k_map):
+    """Map of the cells of a model grid to the cells of a derived grid (e.g. coarsened or cropped), built from
+    one index map per axis.
+
+    Args:
+        i_map (np.array): new x index of every x index of the model grid, -1 for indices outside the new grid
+        j_map (np.array): new y index of every y index, -1 outside
+        k_map (np.array): new z index of every z index, -1 outside
+
+    Returns:
+        dict: 'ij' array of shape (nx, ny, 2) with the new (i, j) of every column, -1 outside, and 'k' the new z index
+    """
+    ij = np.stack(np.meshgrid(np.asarray(i_map), np.asarray(j_map), indexing='ij'), axis=-1)
+    ij[(ij < 0).any(axis=-1)] = -1
+    
+    return {'ij': ij, 'k': np.asarray(k_map)}
 
+def map_cells(cell_map: dict, i, j, k):
+    """Map (0-based) cell indices to the cells of a derived grid.
+
+    Args:
+        cell_map (dict): cell map, see cell_map_from_axes
+        i, j, k (np.array): cell indices in the model grid
+
+    Returns:
+        tuple: new indices (i, j, k) and a mask of the cells which are part of the new grid
+    """
+    ij = cell_map['ij'][i, j]
+    new_k = cell_map['k'][k]
+    valid = (ij[..., 0] >= 0) & (new_k >= 0)
+    
+    return ij[..., 0], ij[..., 1], new_k, valid
+
+def _remap_bc_file(bc_file: str, outfile: str, cell_map: dict, resolution: tuple):
+    """Remap the cell indices of a boundary condition file (i, j, k, value, direction) to a derived grid.
+    Records falling into the same new cell are averaged, records outside the new grid are dropped. A cell map may 
+    define a separate z map 'bc_k' for boundary conditions, e.g. moving records of cropped top layers down."""
+    bc_vals, lines = read_bc_file(bc_file)
+    records = np.loadtxt(bc_vals.splitlines(), delimiter=',', ndmin=2)
+    i, j, k = (records[:, :3].astype(int) - 1).T
+    i, j, k, valid = map_cells(dict(cell_map, k=cell_map.get('bc_k', cell_map['k'])), i, j, k)
+    
+    cells = np.ravel_multi_index((i[valid], j[valid], k[valid]), resolution)
+    cells, first, inverse = np.unique(cells, return_index=True, return_inverse=True)
+    values = np.bincount(inverse, records[valid, 3]) / np.bincount(inverse)
+    
+    ijk = np.stack(np.unravel_index(cells, resolution), axis=1) + 1
+    remapped = np.column_stack([ijk, values, records[valid, 4][first]])
+    with open(outfile, 'w') as file:
+        file.write(format_records(remapped, '%d, %d, %d, %.3f, %d'))
+
+def _read_base_values(hf_file: str, resolution: tuple):
+    """Read basal values (one per column, Fortran order) as array of shape (nx, ny)"""
+    bc_vals, lines = read_bc_file(hf_file)
+    values = np.loadtxt(bc_vals.replace(',', ' ').split())
+    nx, ny = resolution[:2]
+    if values.size != nx*ny:
+        raise ValueError(f"{hf_file} has {values.size} values, expected one per basal cell ({nx*ny}).")
+    
+    return values.reshape((nx, ny), order='F')
+
+def _remap_base_file(hf_file: str, outfile: str, cell_map: dict, resolution: tuple, new_resolution: tuple):
+    """Remap basal values (one per column, Fortran order) to a derived grid, averaging columns in the same new column."""
+    values = _read_base_values(hf_file, resolution)
+    
+    ij = cell_map['ij'].reshape(-1, 2)
+    valid = ij[:, 0] >= 0
+    new_nx, new_ny = new_resolution[:2]
+    columns = ij[valid, 0] + ij[valid, 1] * new_nx
+    # C-ordered columns of the cell map match the values reshaped to (nx, ny)
+    base = values.ravel()[valid]
+    counts = np.bincount(columns, minlength=new_nx*new_ny)
+    if (counts == 0).any():
+        raise ValueError(f"{np.count_nonzero(counts == 0)} basal cells of the new grid have no value in {hf_file}.")
+    remapped = np.bincount(columns, base, minlength=new_nx*new_ny) / counts
+    
+    with open(outfile, 'w') as file:
+        file.write(format_records(remapped.reshape(-1, 1), '%.6g'))
+
+def _remap_data_file(data_file: str, outfile: str, cell_map: dict):
+    """Remap the i, j, k columns of a data file (header with column names, ';' or ',' separated) to a derived grid,
+    data outside the new grid are dropped."""
+    data_vals, data_lines = read_bc_file(data_file)
+    lines = data_vals.splitlines()
+    header = lines[0]
+    sep = ';' if ';' in header else ','
+    columns = [c.strip() for c in header.split(sep)]
+    cols = [columns.index(c) for c in ['i', 'j', 'k']]
+    
+    rows = [line.split(sep) for line in lines[1:] if line.strip()]
+    ijk = np.array([[int(row[c]) for c in cols] for row in rows], dtype=int).reshape(-1, 3) - 1
+    i, j, k, valid = map_cells(cell_map, ijk[:, 0], ijk[:, 1], ijk[:, 2])
+    
+    remapped = [header]
+    for row, new_ijk, inside in zip(rows, zip(i + 1, j + 1, k + 1), valid):
+        if inside:
+            for c, value in zip(cols, new_ijk):
+                row[c] = str(value)
+            remapped.append(sep.join(row))
+    with open(outfile, 'w') as file:
+        file.write("\n".join(remapped) + "\n")
+
+def compose_cell_maps(first: dict, second: dict):
+    """Chain two cell maps, e.g. of a coarsening followed by a crop.
+
+    Args:
+        first (dict): cell map from the model grid to an intermediate grid
+        second (dict): cell map from the intermediate grid to the final grid
+
+    Returns:
+        dict: cell map from the model grid to the final grid
+    """
+    ij = first['ij'].copy()
+    inside = ij[..., 0] >= 0
+    ij[inside] = second['ij'][ij[inside, 0], ij[inside, 1]]
+    composed = {'ij': ij}
+    for key in ['k', 'bc_k']:
+        if key == 'bc_k' and 'bc_k' not in first and 'bc_k' not in second:
+            continue
+        k = first.get(key, first['k']).copy()
+        inside = k >= 0
+        k[inside] = second.get(key, second['k'])[k[inside]]
+        composed[key] = k
+    
+    return composed
+
+def _remap_borehole_logs(borehole_logs: np.array, cell_map: dict):
+    """Remap the (1-based) i, j columns of synthetic borehole logs to a derived grid, logs outside are dropped."""
+    logs = np.array(borehole_logs, copy=True)
+    ij = logs[:, :2].astype(int) - 1
+    new_ij = cell_map['ij'][ij[:, 0], ij[:, 1]]
+    inside = new_ij[:, 0] >= 0
+    logs[:, :2] = new_ij + 1
+    
+    return logs[inside]
+
+def remap_input_files(files: dict, cell_map: dict, grid: dict, new_grid: dict, path: str, filename: str):
+    """Remap boundary condition and data files to a derived grid. The remapped files are written next to the 
+    input file as `<filename>_head_bcd.txt`, `<filename>_temp_bcd.txt`, `<filename>_hf_bcn.txt` and `<filename>_data.csv`.
+
+    Args:
+        files (dict): paths of the 'head_bcs_file', 'top_temp_bcs_file', 'hf_bcs_file' and 'data_file', None if not used
+        cell_map (dict): cell map from the model grid to the new grid, see cell_map_from_axes
+        grid (dict): grid of the model, see get_grid_metadata
+        new_grid (dict): the derived grid
+        path (str): save path for the SHEMAT-Suite input file
+        filename (str): name of the SHEMAT-Suite input file
+
+    Returns:
+        dict: paths of the remapped files
+    """
+    remapped = dict(files)
+    if files.get('head_bcs_file') is not None:
+        remapped['head_bcs_file'] = f"{path}{filename}_head_bcd.txt"
+        _remap_bc_file(files['head_bcs_file'], remapped['head_bcs_file'], cell_map, new_grid['resolution'])
+    if files.get('top_temp_bcs_file') is not None:
+        remapped['top_temp_bcs_file'] = f"{path}{filename}_temp_bcd.txt"
+        _remap_bc_file(files['top_temp_bcs_file'], remapped['top_temp_bcs_file'], cell_map, new_grid['resolution'])
+    if files.get('hf_bcs_file') is not None:
+        remapped['hf_bcs_file'] = f"{path}{filename}_hf_bcn.txt"
+        _remap_base_file(files['hf_bcs_file'], remapped['hf_bcs_file'], cell_map, grid['resolution'], new_grid['resolution'])
+    if files.get('data_file') is not None:
+        remapped['data_file'] = f"{path}{filename}_data.csv"
+        _remap_data_file(files['data_file'], remapped['data_file'], cell_map)
+    
+    return remapped
+
+def coarsen_model(liths: np.ndarray, grid: dict, factors: tuple):
+    """Coarsen a model by integer factors per axis, assigning each coarse cell the unit ID occurring most often 
+    in it (majority vote, ties go to the lower ID).
+
+    Args:
+        liths (np.ndarray): integer unit IDs of shape (nx, ny, nz)
+        grid (dict): grid of the model, see get_grid_metadata
+        factors (tuple): coarsening factors (fx, fy, fz), have to divide the resolution
+
+    Returns:
+        tuple: coarse unit IDs of shape (nx/fx, ny/fy, nz/fz), the coarse grid and the cell map to it
+    """
+    resolution = tuple(int(n) for n in grid['resolution'])
+    factors = tuple(int(f) for f in factors)
+    if any(n % f for n, f in zip(resolution, factors)):
+        raise ValueError(f"Coarsening factors {factors} do not divide the model resolution {resolution}.")
+    new_resolution = tuple(n // f for n, f in zip(resolution, factors))
+    (cx, cy, cz), (fx, fy, fz) = new_resolution, factors
+    
+    blocks = liths.reshape((cx, fx, cy, fy, cz, fz))
+    ids = np.unique(liths)
+    counts = np.stack([(blocks == uid).sum(axis=(1, 3, 5)) for uid in ids], axis=-1)
+    coarse = ids[np.argmax(counts, axis=-1)]
+    
+    coarse_grid = {'resolution': new_resolution,
+                   'extent': grid['extent'],
+                   'spacing': tuple(d * f for d, f in zip(grid['spacing'], factors))}
+    cell_map = cell_map_from_axes(*[np.arange(n) // f for n, f in zip(resolution, factors)])
+    
+    return coarse, coarse_grid, cell_map
+
+def active_bounds(active: np.ndarray):
+    """Minimal bounding box of the active (e.g. non-air) cells of a model.
+
+    Args:
+        active (np.ndarray): boolean mask of shape (nx, ny, nz)
+
+    Returns:
+        tuple: index ranges ((i0, i1), (j0, j1), (k0, k1)), upper bounds exclusive
+    """
+    if not active.any():
+        raise ValueError("The model has no active cells.")
+    bounds = []
+    for axis in range(3):
+        occupied = np.flatnonzero(active.any(axis=tuple(a for a in range(3) if a != axis)))
+        bounds.append((int(occupied[0]), int(occupied[-1]) + 1))
+    
+    return tuple(bounds)
+
+def crop_model(liths: np.ndarray, grid: dict, bounds: tuple):
+    """Cut a sub-grid out of a model, shifting the grid origin accordingly.
+
+    Args:
+        liths (np.ndarray): unit IDs of shape (nx, ny, nz)
+        grid (dict): grid of the model, see get_grid_metadata
+        bounds (tuple): index ranges ((i0, i1), (j0, j1), (k0, k1)) of the sub-grid, upper bounds exclusive
+
+    Returns:
+        tuple: unit IDs of the sub-grid, its grid and the cell map to it
+    """
+    (i0, i1), (j0, j1), (k0, k1) = bounds
+    cropped = liths[i0:i1, j0:j1, k0:k1]
+    
+    spacing = grid['spacing']
+    xmin, ymin, zmin = grid['extent'][0::2]
+    extent = []
+    for (lower, upper), origin, d in zip(bounds, (xmin, ymin, zmin), spacing):
+        extent += [origin + lower * d, origin + upper * d]
+    cropped_grid = {'resolution': cropped.shape, 'extent': tuple(extent), 'spacing': spacing}
+    
+    maps = []
+    for (lower, upper), n in zip(bounds, liths.shape):
+        index = np.arange(n) - lower
+        index[(index < 0) | (index >= upper - lower)] = -1
+        maps.append(index)
+    
+    return cropped, cropped_grid, cell_map_from_axes(*maps)
+
+def roi_bounds(grid: dict, roi: tuple, buffer: float=0., factors: tuple=None):
+    """Index ranges of the cells overlapping a region of interest plus a buffer, limited to the model grid.
+
+    Args:
+        grid (dict): grid of the model, see get_grid_metadata
+        roi (tuple): extent of the region of interest in model coordinates, (xmin, xmax, ymin, ymax) or 
+                     (xmin, xmax, ymin, ymax, zmin, zmax). Without z range, the full model depth is kept.
+        buffer (float, optional): distance added to the region of interest on every side. Defaults to 0.
+        factors (tuple, optional): coarsening factors (fx, fy, fz), the ranges are widened to multiples of them so the 
+                                   region can be coarsened afterwards. Defaults to None.
+
+    Returns:
+        tuple: index ranges ((i0, i1), (j0, j1), (k0, k1)), upper bounds exclusive
+    """
+    extent = grid['extent']
+    if len(roi) == 4:
+        roi = tuple(roi) + (extent[4], extent[5])
+    
+    if factors is None:
+        factors = (1, 1, 1)
+    
+    bounds = []
+    for axis, (n, d, f) in enumerate(zip(grid['resolution'], grid['spacing'], factors)):
+        origin = extent[2*axis]
+        lower = int(np.floor((roi[2*axis] - buffer - origin) / d + 1e-9))
+        upper = int(np.ceil((roi[2*axis+1] + buffer - origin) / d - 1e-9))
+        lower, upper = max(lower, 0), min(upper, n)
+        if lower >= upper:
+            raise ValueError(f"The region of interest {roi} is outside of the model extent {extent}.")
+        if f > 1:
+            # widen to a multiple of the factor, shifted back into the model at its upper end
+            lower = lower // f * f
+            size = -(-(upper - lower) // f) * f
+            if size > n:
+                raise ValueError(f"The region of interest can not be coarsened by {tuple(factors)} along axis {axis}, "
+                                 f"the widened range exceeds the model resolution {int(n)}.")
+            lower = int(min(lower, n - size))
+            upper = lower + size
+        bounds.append((lower, upper))
+    
+    return tuple(bounds)
+
+def _interpolate_regular(axes: tuple, values: np.ndarray, points: np.ndarray):
+    """Trilinear interpolation of values on a regular grid with axes (z, y, x) at points (z, y, x), clamped to the grid."""
+    indices, weights = [], []
+    for axis, coords in zip(axes, points.T):
+        coords = np.clip(coords, axis[0], axis[-1])
+        upper = np.clip(np.searchsorted(axis, coords), 1, len(axis) - 1) if len(axis) > 1 else np.zeros(len(coords), dtype=int)
+        lower = np.maximum(upper - 1, 0)
+        span = axis[upper] - axis[lower]
+        w = np.divide(coords - axis[lower], span, out=np.zeros_like(coords), where=span > 0)
+        indices.append((lower, upper))
+        weights.append((1 - w, w))
+    
+    result = np.zeros(len(points))
+    for corner in range(8):
+        a, b, c = (corner >> 2) & 1, (corner >> 1) & 1, corner & 1
+        result += (weights[0][a] * weights[1][b] * weights[2][c] *
+                   values[indices[0][a], indices[1][b], indices[2][c]])
+    
+    return result
+
+def regional_boundary_temperatures(regional_result: str, grid: dict, active: np.ndarray, origin: tuple, outfile: str):
+    """Write fixed temperatures at the lateral boundaries of a sub-domain model, interpolated from the result of a 
+    (coarser) regional SHEMAT-Suite model.
+
+    Args:
+        regional_result (str): path of the HDF5 result file of the regional model
+        grid (dict): grid of the sub-domain model, see get_grid_metadata
+        active (np.ndarray): boolean mask of shape (nx, ny, nz) of the cells which get boundary temperatures, e.g. all non-air cells
+        origin (tuple): model coordinates (x, y, z) of the origin of the regional SHEMAT-Suite model
+        outfile (str): path of the boundary condition file
+
+    Returns:
+        int: number of boundary cells
+    """
+    with h5py.File(regional_result, 'r') as f:
+        axes = (f['z'][:, 0, 0], f['y'][0, :, 0], f['x'][0, 0, :])
+        temp = f['temp'][:, :, :]
+    
+    nx, ny, nz = grid['resolution']
+    boundary = np.zeros((nx, ny, nz), dtype=bool)
+    boundary[[0, -1], :, :] = True
+    boundary[:, [0, -1], :] = True
+    i, j, k = np.nonzero(boundary & active)
+    
+    xmin, ymin, zmin = grid['extent'][0::2]
+    delx, dely, delz = grid['spacing']
+    points = np.column_stack([zmin + (k + 0.5) * delz - origin[2],
+                              ymin + (j + 0.5) * dely - origin[1],
+                              xmin + (i + 0.5) * delx - origin[0]])
+    values = _interpolate_regular(axes, temp, points)
+    
+    records = np.column_stack([i + 1, j + 1, k + 1, values, np.zeros(len(i))])
+    with open(outfile, 'w') as file:
+        file.write(format_records(records, '%d, %d, %d, %.3f, %d'))
+    
+    return len(i)
+
+def effective_conductivity_units(liths: np.ndarray, coarse: np.ndarray, factors: tuple, units: pd.DataFrame, decimals: int=3):
+    """Assign each coarse cell the harmonic mean thermal conductivity of the fine cells in it. As SHEMAT-Suite 
+    assigns properties per unit, every combination of coarse unit ID and (rounded) effective conductivity becomes a unit.
+
+    Args:
+        liths (np.ndarray): integer unit IDs of the fine grid, shape (nx, ny, nz)
+        coarse (np.ndarray): unit IDs of the coarse grid, see coarsen_model
+        factors (tuple): coarsening factors (fx, fy, fz)
+        units (pd.DataFrame): units table, one row per unit ID in ascending order
+        decimals (int, optional): decimals the effective conductivities are rounded to. Defaults to 3.
+
+    Returns:
+        tuple: new unit IDs of the coarse grid and the corresponding units table
+    """
+    (cx, cy, cz), (fx, fy, fz) = coarse.shape, factors
+    lz = np.concatenate(([np.nan], units['lz'].values.astype(float)))
+    resistivity = (1. / lz[liths]).reshape((cx, fx, cy, fy, cz, fz)).mean(axis=(1, 3, 5))
+    lz_eff = np.round(1. / resistivity, decimals)
+    
+    combinations, inverse = np.unique(np.stack([coarse.ravel(), lz_eff.ravel()], axis=1), axis=0, return_inverse=True)
+    new_units = units.iloc[combinations[:, 0].astype(int) - 1].reset_index(drop=True)
+    new_units['lz'] = combinations[:, 1]
+    new_units['surface'] = [f"{surface}_lz{value}" for surface, value in zip(new_units['surface'], combinations[:, 1])]
+    if 'id' in new_units.columns:
+        new_units['id'] = np.arange(1, len(new_units) + 1)
+    
+    return inverse.reshape(coarse.shape) + 1, new_units
+
+def export_shemat_suite_input_file(geo_model, lithology_block, output: str="vtk hdf",
+                                   units: pd.DataFrame=None, head_bcs_file: str=None, 
+                                   top_temp_bcs_file: str=None, hf_bcs_file: str=None, 
+                                   hf_value: float=0.07, conduction_only: bool=True,
+                                   data_file: str=None, borehole_logs: np.array=None,
+                                   lateral_boundaries: str='closed', individual_init: bool=False,
+                                   coarsen: tuple=None, coarse_lz: bool=False, crop_air: bool=False,
+                                   air_id: int=None, roi: tuple=None, roi_buffer: float=0., regional_result: str=None,
+                                   path: str=None, filename: str='geo_model_SHEMAT_input_erode'):
+    """Method to export a 3D geological model as SHEMAT-Suite input-file for a conductive HT-simulation. 
+
+    Args:
+        geo_model (gp model): gempy model
+        lithology_block (numpy array): array containing the lithology IDs for the regular grid of the model
+        output (str, optional): declare which output files should be generated hdf=HDF5, vtk=VTK, plt=PLT (tecplot)
+        units (pd.DataFrame, optional): unit petrophysical parameters for SHEMAT-Suite model. Defaults to None.
+        head_bcs_file (str, optional): boundary condition file for spatially varying boundary conditions (e.g. head by topography). Defaults to None.
+        top_temp_bcs_file (str, optional): boundary condition file for spatially varying boundary conditions (e.g. temperature due to topography). Defaults to None.
+        data_file (str, optional): data for calibrating the model, e.g. temperatures from boreholes. Defaults to None.
+        borehole_logs (np.array, optional): coordinates for synthetic borehole logs, will write parameters such as pressure and temperature. Defaults to None.
+        lateral_boundaries (str, optional): Lateral BCs. Defaults to 'closed'.
+        individual_init (bool, optional): if True, the model refers to its own initial fields `<filename>_temp_init.h5` and 
+                                          `<filename>_head_init.h5` (see write_initial_fields) instead of the shared 
+                                          `temp_init.h5` and `head_init.h5`. Defaults to False.
+        coarsen (tuple, optional): coarsening factors (fx, fy, fz) for a coarser model, e.g. for fast screening runs. 
+                                   Unit IDs of the coarse cells are assigned by majority vote, cell sizes and boundary 
+                                   condition and data files are rescaled accordingly (written as `<filename>_*` next to 
+                                   the input file). Defaults to None.
+        coarse_lz (bool, optional): with coarsen, write the effective (harmonic mean) thermal conductivity of each coarse cell.
+                                    Every combination of unit and effective conductivity becomes a unit of its own. 
+                                    Requires units. Defaults to False.
+        crop_air (bool, optional): write only the bounding box of non-air cells plus one air layer on top, i.e. drop layers 
+                                   and columns consisting of air only (see topomask). Grid, boundary condition, data and borehole
+                                   indices are shifted accordingly. Boundary conditions of dropped top layers are moved down
+                                   into the top layer of their column (averaged per cell), so every column keeps its surface 
+                                   condition. Defaults to False.
+        air_id (int, optional): unit ID of the air for crop_air and regional_result. Defaults to None, i.e. highest surface ID + 1.
+        roi (tuple, optional): export only a region of interest (xmin, xmax, ymin, ymax) or (xmin, xmax, ymin, ymax, zmin, zmax) 
+                               in model coordinates, e.g. for local high-resolution models. Grid, boundary condition, data and 
+                               borehole indices are remapped like for crop_air. It is applied before coarsen and widened 
+                     to multiples of the coarsening factors. Defaults to None.
+        roi_buffer (float, optional): buffer around roi, in model units. Defaults to 0.
+        regional_result (str, optional): HDF5 result of a (coarser) regional model of the full extent. With roi, its temperatures 
+                                         are fixed at the lateral boundaries of the sub-domain (non-air cells), see 
+                                         regional_boundary_temperatures. Defaults to None.
+        path (str, optional): save path for the SHEMAT-Suite input file. Defaults to None.
+        filename (str, optional): name of the SHEMAt-Suite input file. Defaults to 'geo_model_SHEMAT_input_erode'.
+    """
     if not path:
         path = './'
     if not os.path.exists(path):
         os.makedirs(path)
+    
+    grid = get_grid_metadata(geo_model)
+    files = {'head_bcs_file': head_bcs_file, 'top_temp_bcs_file': top_temp_bcs_file,
+             'hf_bcs_file': hf_bcs_file, 'data_file': data_file}
+    
+    if regional_result is not None and roi is None:
+        raise ValueError("Boundary temperatures from a regional result require a region of interest (roi).")
+    
+    if coarsen is not None or crop_air or roi is not None:
+        model_grid = grid
+        liths = np.round(lithology_block).astype(int).reshape(grid['resolution'])
+        cell_map = cell_map_from_axes(*[np.arange(n) for n in grid['resolution']])
+        if air_id is None:
+            air_id = geo_model.surfaces.df['id'].max() + 1
+        
+        if roi is not None:
+            liths, grid, roi_map = crop_model(liths, grid, roi_bounds(grid, roi, roi_buffer, factors=coarsen))
+            cell_map = compose_cell_maps(cell_map, roi_map)
+        # air cells are identified before effective conductivities renumber the units
+        active = liths != air_id
+        
+        if coarsen is not None:
+            coarse_liths, grid, coarse_map = coarsen_model(liths, grid, coarsen)
+            cell_map = compose_cell_maps(cell_map, coarse_map)
+            active = coarse_liths != air_id
+            if coarse_lz:
+                if units is None:
+                    raise ValueError("Effective thermal conductivities of coarse cells require a units table.")
+                coarse_liths, units = effective_conductivity_units(liths, coarse_liths, coarsen, units)
+            liths = coarse_liths
+        if crop_air:
+            # keep one air layer above the highest non-air cell, it carries the top boundary conditions
+            bounds = active_bounds(active)
+            bounds = bounds[:2] + ((bounds[2][0], min(bounds[2][1] + 1, active.shape[2])),)
+            active = crop_model(active, grid, bounds)[0]
+            liths, grid, crop_map = crop_model(liths, grid, bounds)
+            # boundary conditions of dropped top layers move down into the top layer
+            k0, k1 = bounds[2]
+            crop_map['bc_k'] = np.where(np.arange(len(crop_map['k'])) >= k1, k1 - k0 - 1, crop_map['k'])
+            cell_map = compose_cell_maps(cell_map, crop_map)
+        
+        files = remap_input_files(files, cell_map, model_grid, grid, path, filename)
+        if regional_result is not None:
+            files['lateral_temp_bcs_file'] = f"{path}{filename}_lateral_temp_bcd.txt"
+            regional_boundary_temperatures(regional_result, grid, active, model_grid['extent'][0::2],
+                                           files['lateral_temp_bcs_file'])
+        if borehole_logs is not None:
+            borehole_logs = _remap_borehole_logs(borehole_logs, cell_map)
+        lithology_block = liths.ravel()
+    
+    sections = shemat_input_sections(geo_model, output=output, units=units, hf_value=hf_value,
+                                     conduction_only=conduction_only, borehole_logs=borehole_logs,
+                                     lateral_boundaries=lateral_boundaries, individual_init=individual_init,
+                                     grid=grid, **files)
+
+    # unit IDs are grouped in space-saving way while writing
+    write_shemat_input(sections, lithology_block, grid['resolution'], path, filename)
+    
+    print(f"Successfully exported geological model {filename} as SHEMAT-Suite input to "+path)
+
+def write_shemade_job(model_names: list, path: str='./', jobname: str='shemade.job'):
+    """Write the list of models to be simulated by SHEMAT-Suite, i.e. the shemade.job file.
+
+    Args:
+        model_names (list): names of the SHEMAT-Suite input files
+        path (str, optional): folder of the SHEMAT-Suite input files. Defaults to './'.
+        jobname (str, optional): name of the job file. Defaults to 'shemade.job'.
+    """
+    with open(path+jobname, 'w') as jobfile:
+        jobfile.write(" \n".join(model_names))
+
+def _parse_repeated(tokens: list):
+    """Decode SHEMAT-Suite value lists with repetitions, e.g. ['100*280.0'] or ['2*10', '5.']"""
+    counts, values = [], []
+    for token in tokens:
+        count, _, value = token.rpartition('*')
+        counts.append(int(count) if count else 1)
+        values.append(float(value.replace('d', 'e').replace('D', 'e')))
+    
+    return np.repeat(values, counts)
+
+def _parse_number(value: str):
+    value = value.replace('d', 'e').replace('D', 'e')
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+def decode_uindex(block, resolution: tuple):
+    """Decode a run-length encoded `# uindex` block (pairs `count*id`) into unit IDs.
+
+    Args:
+        block (bytes or str): the uindex block
+        resolution (tuple): model resolution (nx, ny, nz)
+
+    Returns:
+        np.ndarray: unit IDs of shape (nx, ny, nz), i.e. `.ravel()` gives a lith block in the order of gempy
+    """
+    if isinstance(block, str):
+        block = block.encode()
+    pairs = np.fromstring(block.replace(b'*', b' '), dtype=np.int64, sep=' ').reshape(-1, 2)
+    ids = np.repeat(pairs[:, 1], pairs[:, 0])
+    if ids.size != np.prod(resolution):
+        raise ValueError(f"uindex block has {ids.size} cells, expected {np.prod(resolution)} for the resolution {resolution}.")
+    
+    return ids.reshape(resolution, order='F')
+
+def read_shemat_input(filepath: str, uindex: bool=True):
+    """Read the model of an existing SHEMAT-Suite input file, e.g. for validating, re-exporting or evaluating exported ensembles.
+    The file is memory-mapped, so only the header is parsed line by line and the `# uindex` block is decoded in one go.
+
+    Args:
+        filepath (str): path of the SHEMAT-Suite input file
+        uindex (bool, optional): decode the `# uindex` block. Defaults to True.
 
-    f = open(path+filename, 'w+')
+    Returns:
+        dict: 'title', 'resolution' (nx, ny, nz), cell sizes 'delx', 'dely', 'delz' (arrays), 'units' (pd.DataFrame with the
+              columns 'surface', 'por', 'perm' and 'lz' as in format_units, row i is unit ID i+1) and 'uindex' (unit IDs of 
+              shape (nx, ny, nz), see decode_uindex)
+    """
+    with open(filepath, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = mm.rfind(b'# uindex')
+        if start < 0:
+            raise ValueError(f"{filepath} has no uindex block.")
+        header = mm[:start].decode()
+        block = mm[mm.find(b'\n', start) + 1:] if uindex else None
     
-    f.write(fstring)
-    f.close()
+    # keyword lines start with '#', their values follow up to the next empty line or keyword
+    sections = {}
+    key = None
+    for line in header.splitlines():
+        if line.startswith('#'):
+            key = line[1:].strip()
+            sections[key] = []
+        elif not line.strip() or line.startswith('!'):
+            key = None
+        elif key is not None:
+            sections[key].append(line)
+    
+    resolution = tuple(int(n) for n in sections['grid'][0].split())
+    model = {'title': sections.get('Title', [''])[0].strip(), 'resolution': resolution}
+    for name in ['delx', 'dely', 'delz']:
+        model[name] = _parse_repeated(" ".join(sections[name]).split())
+    
+    units = []
+    for line in sections.get('units', []):
+        values, _, surface = line.partition('!')
+        values = values.split()
+        units.append({'surface': surface.strip(), 'por': _parse_number(values[0]),
+                      'perm': _parse_number(values[3]), 'lz': _parse_number(values[7])})
+    model['units'] = pd.DataFrame(units, columns=['surface', 'por', 'perm', 'lz'])
+    
+    if uindex:
+        model['uindex'] = decode_uindex(block, resolution)
+    
+    return model
+
+def hash_lith_block(lithology_block):
+    """Content hash of a lith block, based on its rounded integer unit IDs.
+
+    Args:
+        lithology_block (np.array): lith block of a gempy model
+
+    Returns:
+        str: hexadecimal hash of the lith block
+    """
+    ids = np.ascontiguousarray(np.round(lithology_block).astype(np.int64))
+    
+    return hashlib.blake2b(ids.tobytes(), digest_size=16).hexdigest()
+
+def _hash_text(text: str):
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+def _read_manifest(manifest_file: str):
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file, 'r') as file:
+        return json.load(file)
+
+# state of an export worker process, set once per process by _init_export_worker
+_WORKER_STATE = {}
+
+def _init_export_worker(sections: dict, resolution: tuple, path: str):
+    _WORKER_STATE['sections'] = sections
+    _WORKER_STATE['resolution'] = resolution
+    _WORKER_STATE['path'] = path
+
+def _export_worker(lithology_block, filename: str, unitstring: str=None):
+    sections = _WORKER_STATE['sections']
+    if unitstring is not None:
+        sections = dict(sections, units=unitstring)
+    write_shemat_input(sections, lithology_block, _WORKER_STATE['resolution'],
+                       _WORKER_STATE['path'], filename)
+    
+    return filename
+
+def export_shemat_ensemble(geo_model, lith_blocks, output: str="vtk hdf",
+                           units: pd.DataFrame=None, head_bcs_file: str=None, 
+                           top_temp_bcs_file: str=None, hf_bcs_file: str=None, 
+                           hf_value: float=0.07, conduction_only: bool=True,
+                           data_file: str=None, borehole_logs: np.array=None,
+                           lateral_boundaries: str='closed', individual_init: bool=False,
+                           path: str=None, filenames: list=None, prefix: str='model_',
+                           units_ensemble: list=None, n_workers: int=1, job_file: str=None,
+                           incremental: bool=False, manifest: str='export_manifest.json', grid: dict=None):
+    """Export an ensemble of lith blocks, e.g. from a Monte Carlo simulation, as SHEMAT-Suite input files.
+    All parts of the input file which do not change between realizations are built once, so only the 
+    `# uindex` block is generated per realization.
+
+    Args:
+        geo_model (gp model): gempy model
+        lith_blocks (np.array): lith blocks of the ensemble, shape (n_realizations, n_cells). A single lith block of shape (n_cells,) 
+                                is used for all realizations, e.g. for a petrophysical ensemble given by units_ensemble.
+        filenames (list, optional): names of the SHEMAT-Suite input files. Defaults to None, i.e. prefix + realization number.
+        prefix (str, optional): prefix of the file names if no filenames are given. Defaults to 'model_'.
+        units_ensemble (list, optional): units tables per realization, e.g. from sample_unit_parameters. Only the units section 
+                                        differs between the files then. Defaults to None, i.e. units is used for all realizations.
+        n_workers (int, optional): number of worker processes writing the input files. Workers only receive the
+                                   prebuilt sections and the grid resolution, not the gempy model. On platforms 
+                                   spawning processes (Windows, macOS), call this from within an 
+                                   `if __name__ == '__main__':` block. Defaults to 1, i.e. serial export.
+        job_file (str, optional): if given, write the list of exported models to this job file (e.g. 'shemade.job') in path. Defaults to None.
+        incremental (bool, optional): only write files whose content changed since the last export. For every file, the manifest 
+                                      stores hashes of the lith block, the units section, the boundary sections (BC and data 
+                                      file contents) and the remaining settings. Files with unchanged hashes are skipped. Defaults to False.
+        manifest (str, optional): name of the manifest file in path used for incremental exports. Defaults to 'export_manifest.json'.
+        grid (dict, optional): grid of the lith blocks if it differs from the regular grid of geo_model, e.g. for profiles. 
+                               BC and data files have to match this grid. Defaults to None.
+        for all other arguments, see export_shemat_suite_input_file
+
+    Returns:
+        list: names of the exported input files
+    """
+    if grid is None:
+        grid = get_grid_metadata(geo_model)
+    sections = shemat_input_sections(geo_model, output=output, units=units, head_bcs_file=head_bcs_file,
+                                     top_temp_bcs_file=top_temp_bcs_file, hf_bcs_file=hf_bcs_file,
+                                     hf_value=hf_value, conduction_only=conduction_only,
+                                     data_file=data_file, borehole_logs=borehole_logs,
+                                     lateral_boundaries=lateral_boundaries, individual_init=individual_init,
+                                     grid=grid)
+    resolution = grid['resolution']
+    
+    if np.ndim(lith_blocks) == 1:
+        if units_ensemble is None:
+            raise ValueError("A single lith block requires units_ensemble to define the realizations.")
+        n_realizations = len(units_ensemble)
+        get_block = lambda i: lith_blocks
+    else:
+        n_realizations = len(lith_blocks)
+        get_block = lambda i: lith_blocks[i]
+    if units_ensemble is not None and len(units_ensemble) != n_realizations:
+        raise ValueError(f"Got {len(units_ensemble)} units tables for {n_realizations} realizations.")
+    
+    if filenames is None:
+        filenames = [f"{prefix}{i}" for i in range(n_realizations)]
+    if len(filenames) != n_realizations:
+        raise ValueError(f"Got {len(filenames)} filenames for {n_realizations} realizations.")
+    
+    if units_ensemble is None:
+        unitstrings = [None] * n_realizations
+    else:
+        unitstrings = [format_units(u) for u in units_ensemble]
+
+    if not path:
+        path = './'
+    if not os.path.exists(path):
+        os.makedirs(path)
+    
+    # select files whose content changed
+    stale = list(range(n_realizations))
+    if incremental:
+        previous = _read_manifest(path+manifest)
+        settings_hash = _hash_text(sections['info'] + sections['setup'] + str(tuple(resolution)))
+        boundaries_hash = _hash_text(sections['boundaries'])
+        single_block_hash = hash_lith_block(lith_blocks) if np.ndim(lith_blocks) == 1 else None
+        
+        entries = {}
+        stale = []
+        for i, filename in enumerate(filenames):
+            entries[filename] = {'lith_block': single_block_hash or hash_lith_block(get_block(i)),
+                                 'units': _hash_text(unitstrings[i] or sections['units']),
+                                 'boundaries': boundaries_hash,
+                                 'settings': settings_hash}
+            if previous.get(filename) != entries[filename] or not os.path.exists(path+filename):
+                stale.append(i)
+    
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_export_worker,
+                                 initargs=(sections, resolution, path)) as pool:
+            # a bounded number of lith blocks in flight, so lazily decoded ensembles are never held in memory at once
+            pending = deque()
+            for i in stale:
+                pending.append(pool.submit(_export_worker, get_block(i), filenames[i], unitstrings[i]))
+                if len(pending) >= 2 * n_workers:
+                    pending.popleft().result()
+            while pending:
+                pending.popleft().result()
+    else:
+        for i in stale:
+            file_sections = sections if unitstrings[i] is None else dict(sections, units=unitstrings[i])
+            write_shemat_input(file_sections, get_block(i), resolution, path, filenames[i])
+    
+    if incremental:
+        previous.update(entries)
+        with open(path+manifest, 'w') as file:
+            json.dump(previous, file, indent=1)
+    
+    if job_file is not None:
+        write_shemade_job(filenames, path, job_file)
+    
+    print(f"Successfully exported {len(stale)} geological models as SHEMAT-Suite input to "+path)
+    if len(stale) < n_realizations:
+        print(f"{n_realizations - len(stale)} models were unchanged and skipped.")
+    
+    return filenames
+
+def profile_cells(grid: dict, direction: str='x', position: float=None, polyline: np.array=None, spacing: float=None):
+    """Columns of the model grid sampled by a vertical profile, either along x or y at a fixed coordinate or along a polyline.
+
+    Args:
+        grid (dict): grid of the model, see get_grid_metadata
+        direction (str, optional): 'x' for a profile along x (fixed y), 'y' for a profile along y (fixed x) or 'polyline'. Defaults to 'x'.
+        position (float, optional): y (direction 'x') or x (direction 'y') coordinate of the profile. Defaults to None, i.e. the model center.
+        polyline (np.array, optional): (x, y) coordinates of the polyline vertices, shape (n, 2), for direction 'polyline'. Defaults to None.
+        spacing (float, optional): distance of the profile cells along the polyline. Defaults to None, i.e. the smaller of delx and dely.
+
+    Returns:
+        tuple: (i, j) indices of the sampled columns, distance of the profile cell centers along the profile 
+               and the (x, y) coordinates of the profile cell centers
+    """
+    nx, ny, nz = grid['resolution']
+    xmin, xmax, ymin, ymax = grid['extent'][:4]
+    delx, dely, delz = grid['spacing']
+    
+    if direction in ('x', 'y'):
+        if direction == 'x':
+            y = (ymin + ymax) / 2 if position is None else position
+            polyline = np.array([[xmin, y], [xmax, y]])
+            spacing = delx
+        else:
+            x = (xmin + xmax) / 2 if position is None else position
+            polyline = np.array([[x, ymin], [x, ymax]])
+            spacing = dely
+    elif direction == 'polyline':
+        if polyline is None:
+            raise ValueError("A profile along a polyline requires the polyline vertices.")
+        polyline = np.asarray(polyline, dtype=float)
+        if spacing is None:
+            spacing = min(delx, dely)
+    else:
+        raise ValueError(f"Unknown profile direction {direction}, use 'x', 'y' or 'polyline'.")
+    
+    segments = np.linalg.norm(np.diff(polyline, axis=0), axis=1)
+    vertex_dist = np.concatenate(([0.], np.cumsum(segments)))
+    n_cells = int(round(vertex_dist[-1] / spacing))
+    distance = (np.arange(n_cells) + 0.5) * spacing
+    xy = np.column_stack([np.interp(distance, vertex_dist, polyline[:, 0]),
+                          np.interp(distance, vertex_dist, polyline[:, 1])])
+    
+    i = np.floor((xy[:, 0] - xmin) / delx).astype(int)
+    j = np.floor((xy[:, 1] - ymin) / dely).astype(int)
+    if (i < 0).any() or (i >= nx).any() or (j < 0).any() or (j >= ny).any():
+        raise ValueError("The profile leaves the model extent.")
+    
+    return i, j, distance, xy
+
+def _profile_bc_file(bc_file: str, outfile: str, i: np.array, j: np.array, ny: int):
+    """Write the boundary condition records of the columns sampled by a profile, for every profile cell n the records of 
+    column (i[n], j[n]). A column sampled by several profile cells provides its records to each of them."""
+    bc_vals, lines = read_bc_file(bc_file)
+    records = np.loadtxt(bc_vals.splitlines(), delimiter=',', ndmin=2)
+    columns = (records[:, 0].astype(int) - 1) * ny + (records[:, 1].astype(int) - 1)
+    order = np.argsort(columns, kind='stable')
+    
+    sampled = i * ny + j
+    first = np.searchsorted(columns[order], sampled, side='left')
+    last = np.searchsorted(columns[order], sampled, side='right')
+    counts = last - first
+    selected = order[np.concatenate([np.arange(a, b) for a, b in zip(first, last)]).astype(int)]
+    
+    profiled = records[selected].copy()
+    profiled[:, 0] = np.repeat(np.arange(len(i)), counts) + 1
+    profiled[:, 1] = 1
+    with open(outfile, 'w') as file:
+        file.write(format_records(profiled, '%d, %d, %d, %.3f, %d'))
+
+def _profile_base_file(hf_file: str, outfile: str, i: np.array, j: np.array, resolution: tuple):
+    """Write the basal values of the columns sampled by a profile, one per profile cell"""
+    values = _read_base_values(hf_file, resolution)
+    with open(outfile, 'w') as file:
+        file.write(format_records(values[i, j].reshape(-1, 1), '%.6g'))
+
+def _projection_map(grid: dict, i: np.array, j: np.array, max_distance: float=None):
+    """Cell map from the model grid to a profile grid (profile along x, ny=1), assigning every column to its nearest 
+    profile cell, e.g. for projecting data and boreholes onto the profile."""
+    nx, ny, nz = grid['resolution']
+    delx, dely = grid['spacing'][:2]
+    
+    ci, cj = np.meshgrid(np.arange(nx), np.arange(ny), indexing='ij')
+    ci, cj = ci.ravel(), cj.ravel()
+    projected = np.zeros((nx*ny, 2), dtype=int)
+    # nearest profile cell of every column, in chunks to bound the size of the distance matrix
+    for start in range(0, nx*ny, 4096):
+        dist = np.hypot((ci[start:start+4096, None] - i[None, :]) * delx, (cj[start:start+4096, None] - j[None, :]) * dely)
+        nearest = dist.argmin(axis=1)
+        projected[start:start+4096, 0] = nearest
+        if max_distance is not None:
+            projected[start:start+4096][dist[np.arange(len(nearest)), nearest] > max_distance] = -1
+    
+    return {'ij': projected.reshape((nx, ny, 2)), 'k': np.arange(nz)}
+
+def export_shemat_profiles(geo_model, lith_blocks, direction: str='x', position: float=None, polyline: np.array=None,
+                           spacing: float=None, max_distance: float=None, output: str="vtk hdf",
+                           units: pd.DataFrame=None, head_bcs_file: str=None, 
+                           top_temp_bcs_file: str=None, hf_bcs_file: str=None, 
+                           hf_value: float=0.07, conduction_only: bool=True,
+                           data_file: str=None, borehole_logs: np.array=None,
+                           lateral_boundaries: str='closed', path: str=None, filenames: list=None, 
+                           prefix: str='profile_', n_workers: int=1, job_file: str=None, chunk_size: int=64):
+    """Export 2D profile models (ny=1) cut from the 3D lith blocks of an ensemble, e.g. for a fast 2D screening of many 
+    realizations before running 3D models. The profile runs along x, along y or along a polyline (see profile_cells), its cells 
+    are numbered along the profile in x direction. For all directions, the x coordinate of the profile grid is the distance 
+    along the profile, y spans one cell width.
+
+    Each profile cell takes the boundary conditions and basal values of the column it samples. Data and borehole logs are 
+    projected onto the nearest profile cell. Remapped files are written to path as `<prefix>_head_bcd.txt`, `<prefix>_temp_bcd.txt`,
+    `<prefix>_hf_bcn.txt` and `<prefix>_data.csv`, with a trailing '_' of the prefix dropped (e.g. `profile_head_bcd.txt`).
+
+    Args:
+        geo_model (gp model): gempy model
+        lith_blocks (np.array or LithEnsemble): lith blocks of the ensemble, shape (n_realizations, n_cells)
+        direction (str, optional): 'x', 'y' or 'polyline', see profile_cells. Defaults to 'x'.
+        position (float, optional): coordinate of a profile along x or y, see profile_cells. Defaults to None.
+        polyline (np.array, optional): (x, y) vertices of a polyline profile. Defaults to None.
+        spacing (float, optional): cell size along a polyline profile. Defaults to None.
+        max_distance (float, optional): maximum distance of data and boreholes from the profile, farther ones are dropped. 
+                                        Defaults to None, i.e. all are projected.
+        chunk_size (int, optional): number of realizations cut at once. Defaults to 64.
+        for all other arguments, see export_shemat_ensemble
+
+    Returns:
+        list: names of the exported input files
+    """
+    grid = get_grid_metadata(geo_model)
+    nz = grid['resolution'][2]
+    i, j, distance, xy = profile_cells(grid, direction=direction, position=position, polyline=polyline, spacing=spacing)
+    projected = _projection_map(grid, i, j, max_distance=max_distance)
+    
+    ds = distance[1] - distance[0] if len(distance) > 1 else 2 * distance[0]
+    profile_grid = {'resolution': (len(distance), 1, nz),
+                    'extent': (0., len(distance) * ds, 0., ds) + tuple(grid['extent'][4:]),
+                    'spacing': (ds, ds, grid['spacing'][2])}
+    
+    if not path:
+        path = './'
+    if not os.path.exists(path):
+        os.makedirs(path)
+    
+    name = prefix.rstrip('_') or 'profile'
+    files = {}
+    if head_bcs_file is not None:
+        files['head_bcs_file'] = f"{path}{name}_head_bcd.txt"
+        _profile_bc_file(head_bcs_file, files['head_bcs_file'], i, j, grid['resolution'][1])
+    if top_temp_bcs_file is not None:
+        files['top_temp_bcs_file'] = f"{path}{name}_temp_bcd.txt"
+        _profile_bc_file(top_temp_bcs_file, files['top_temp_bcs_file'], i, j, grid['resolution'][1])
+    if hf_bcs_file is not None:
+        files['hf_bcs_file'] = f"{path}{name}_hf_bcn.txt"
+        _profile_base_file(hf_bcs_file, files['hf_bcs_file'], i, j, grid['resolution'])
+    if data_file is not None:
+        files['data_file'] = f"{path}{name}_data.csv"
+        _remap_data_file(data_file, files['data_file'], projected)
+    if borehole_logs is not None:
+        borehole_logs = _remap_borehole_logs(borehole_logs, projected)
+    
+    n_realizations = len(lith_blocks)
+    profiles = np.empty((n_realizations, len(distance) * nz), dtype=int)
+    for start in range(0, n_realizations, chunk_size):
+        blocks = np.rint(np.asarray(lith_blocks[start:start+chunk_size])).astype(int)
+        blocks = blocks.reshape((-1,) + tuple(grid['resolution']))
+        profiles[start:start+chunk_size] = blocks[:, i, j, :].reshape(len(blocks), -1)
+    
+    return export_shemat_ensemble(geo_model, profiles, output=output, units=units, hf_value=hf_value,
+                                  conduction_only=conduction_only, borehole_logs=borehole_logs,
+                                  lateral_boundaries=lateral_boundaries, path=path, filenames=filenames,
+                                  prefix=prefix, n_workers=n_workers, job_file=job_file, grid=profile_grid, **files)
+
+def conductive_geotherm(geo_model, lithology_block, units: pd.DataFrame, surface_temp=10., heat_flow=0.07):
+    """Calculate a layered, purely conductive geotherm for a lith block, e.g. as initial temperature field.
+    In each column, the temperature increases from the surface temperature at the top of the model 
+    with the basal heat flow times the thermal resistance (dz/lz) of the cells above.
+
+    Args:
+        geo_model (gp model): gempy model
+        lithology_block (np.array): lith block, masked with topography if the units table contains air
+        units (pd.DataFrame): units table with the thermal conductivity 'lz', one row per unit ID in ascending order
+        surface_temp (float or np.ndarray, optional): temperature at the top of the model in °C, scalar or of shape (nx, ny). Defaults to 10.
+        heat_flow (float or np.ndarray, optional): heat flow in W/m², scalar or of shape (nx, ny). Defaults to 0.07.
+
+    Returns:
+        np.ndarray: temperature at the cell centers in °C, shape (nx, ny, nz)
+    """
+    grid = get_grid_metadata(geo_model)
+    nx, ny, nz = grid['resolution']
+    delz = grid['spacing'][2]
+    
+    # unit IDs start at 1
+    lz = np.concatenate(([np.nan], units['lz'].values.astype(float)))
+    liths = np.round(lithology_block).astype(int).reshape((nx, ny, nz))
+    resistance = delz / lz[liths]
+    
+    # resistance above each cell center, z increases with the index
+    above = np.cumsum(resistance[:, :, ::-1], axis=2)[:, :, ::-1] - 0.5 * resistance
+    surface_temp = np.asarray(surface_temp, dtype=float)
+    heat_flow = np.asarray(heat_flow, dtype=float)
+    if surface_temp.ndim == 2:
+        surface_temp = surface_temp[:, :, np.newaxis]
+    if heat_flow.ndim == 2:
+        heat_flow = heat_flow[:, :, np.newaxis]
+    
+    return surface_temp + heat_flow * above
+
+def write_initial_fields(geo_model, path: str='./', temp: np.ndarray=None, head=None, base_model_file: str=None,
+                         filename: str=None):
+    """Write HDF5 files with initial temperature and head fields for SHEMAT-Suite (`temp_init.h5` and `head_init.h5`).
+    Fields are either given in the layout of the gempy regular grid (nx, ny, nz), e.g. from conductive_geotherm,
+    or taken from the final fields of a simulated model, e.g. the base model.
+
+    Args:
+        geo_model (gp model): gempy model
+        path (str, optional): folder of the SHEMAT-Suite input files. Defaults to './'.
+        temp (np.ndarray, optional): initial temperature of shape (nx, ny, nz). Defaults to None.
+        head (float or np.ndarray, optional): initial head, scalar or of shape (nx, ny, nz). Defaults to None, i.e. 
+                                              the hydrostatic head of the model height, as in the default head boundary condition.
+        base_model_file (str, optional): SHEMAT-Suite HDF5 result file, whose temperature and head are used if temp is not given. 
+                                         Defaults to None.
+        filename (str, optional): model name, if given, files are written as `<filename>_temp_init.h5`, see individual_init 
+                                  of export_shemat_suite_input_file. Defaults to None.
+    """
+    grid = get_grid_metadata(geo_model)
+    nx, ny, nz = grid['resolution']
+    delz = grid['spacing'][2]
+    
+    if temp is not None:
+        # SHEMAT-Suite stores fields as (z, y, x)
+        temp = np.transpose(np.reshape(temp, (nx, ny, nz)))
+        if head is None:
+            head = nz*delz
+        head = np.transpose(np.broadcast_to(np.asarray(head, dtype=float), (nx, ny, nz)))
+    elif base_model_file is not None:
+        with h5py.File(base_model_file, 'r') as base:
+            temp = base['temp'][:,:,:]
+            if head is None:
+                head = base['head'][:,:,:]
+            else:
+                head = np.transpose(np.broadcast_to(np.asarray(head, dtype=float), (nx, ny, nz)))
+    else:
+        raise ValueError("Either an initial temperature field or a base model file is required.")
+    
+    if temp.shape != (nz, ny, nx):
+        raise ValueError(f"Initial temperature has shape {temp.shape}, the model grid requires {(nz, ny, nx)}.")
+    
+    if not os.path.exists(path):
+        os.makedirs(path)
+    prefix = f"{filename}_" if filename is not None else ""
     
-    print(f"Successfully exported geological model {filename} as SHEMAT-Suite input to "+path)
\ No newline at end of file
+    for name, values in [('temp', temp), ('head', head)]:
+        with h5py.File(f"{path}{prefix}{name}_init.h5", 'w') as f:
+            f.create_dataset(name, data=values)
@@ -151,14 +151,15 @@ gp.set_interpolator(geo_model, output=['gravity'],
 
 #%%
 # Now we are good to go and run the Monte Carlo simulation. In the following, we fix a numpy random number seed so that this MC-simulation is reproducible
-# Then, we create empty arrays and dictionaries for the lithologies and gravity, respectively. In a `for` loop, we then vary depths of interface points and
-# compute a model.
+# Then, we open an `EnsembleStore` from `OpenWF.ensemble`, an HDF5 file to which the lithologies, the gravity and the sampled depth variations
+# of each realization are appended as soon as it is computed. So memory use stays the same, no matter how many realizations we compute. In a `for` loop,
+# we then vary depths of interface points and compute a model.
+
+import sys
+sys.path.append('../../')
+import OpenWF.ensemble as owf_ens
 
 np.random.seed(1)
-# allocate array for lithology blocks
-lith_blocks = np.array([])
-# create a dictionary to store gravity of simulations
-grav = dict() 
 # get indices where the variable input points are
 Lgraben = list(graben_lower.index)
 Ugraben = list(graben_middle.index)
@@ -168,22 +169,27 @@ Cindices = Lgraben + Ugraben + Uncon
 # set number of realizations
 n_iterations = 10
 
-for i in range(n_iterations):
-    # vary surface points   
-    Z_var = np.random.normal(0, 300, size=3)    
-    Z_loc = np.hstack([Z_init[Lgraben] + Z_var[0],
-                       Z_init[Ugraben] + Z_var[1],
-                       Z_init[Uncon] + Z_var[2]])
-    # apply variation to model
-    geo_model.modify_surface_points(Cindices, Z=Z_loc)
-    # re-compute model
-    gp.compute_model(geo_model)
-    # store lithologies ONLY THERE IF REGULAR GRID IS ACTIVE
-    lith_blocks = np.append(lith_blocks, geo_model.solutions.lith_block)
-    # store gravity
-    grav[f"Real_{i}"] = geo_model.solutions.fw_gravity
-
-lith_blocks = lith_blocks.reshape(n_iterations, -1)
+with owf_ens.EnsembleStore('../../data/outputs/MCexample_10realizations.h5', mode='w') as store:
+    for i in range(n_iterations):
+        # vary surface points   
+        Z_var = np.random.normal(0, 300, size=3)    
+        Z_loc = np.hstack([Z_init[Lgraben] + Z_var[0],
+                           Z_init[Ugraben] + Z_var[1],
+                           Z_init[Uncon] + Z_var[2]])
+        # apply variation to model
+        geo_model.modify_surface_points(Cindices, Z=Z_loc)
+        # re-compute model
+        gp.compute_model(geo_model)
+        # store lithologies (ONLY THERE IF REGULAR GRID IS ACTIVE), gravity and depth variations
+        store.append(geo_model.solutions.lith_block, fw_gravity=geo_model.solutions.fw_gravity, Z_var=Z_var)
+
+#%%
+# For the small ensemble of this tutorial, we can read everything back into memory. For large ensembles, `store.iter_chunks()` reads
+# the realizations chunk by chunk instead.
+
+with owf_ens.EnsembleStore('../../data/outputs/MCexample_10realizations.h5', mode='r') as store:
+    lith_blocks = store['lith_blocks'].astype(float)
+    grav = {f"Real_{i}": g for i, g in enumerate(store['fw_gravity'])}
 
 #%%
 # Export models and gravity
@@ -205,6 +211,14 @@ gravdf.head()
 
 np.save('../../data/outputs/MCexample_10realizations.npy', lith_blocks)
 
+#%%
+# The lith blocks are stored as float64, i.e. 8 bytes per cell for a unit ID which fits into one byte. For larger ensembles,
+# `OpenWF.ensemble` stores them compressed as uint8 codes with a lookup table of unit IDs. Loading the ensemble memory-maps the codes,
+# and the loaded ensemble can be passed to OpenWF methods like an array of lith blocks.
+
+owf_ens.save_lith_ensemble('../../data/outputs/MCexample_10realizations.npz', lith_blocks)
+lith_ensemble = owf_ens.load_lith_ensemble('../../data/outputs/MCexample_10realizations.npz')
+
 #%%
 # Quick model analysis
 # --------------------
@@ -11,6 +11,7 @@
 import os,sys
 sys.path.append('../../')
 import OpenWF.shemat_preprocessing as shemsuite
+import OpenWF.ensemble as owf_ens
 import glob
 import numpy as np
 import itertools as it
@@ -37,14 +38,12 @@ dtm = np.load(model_path+'/POC_PCT_model_topography.npy')
 #%%
 # Load the MC-lithologies
 # -----------------------
-# Next, we load the lithology blocks created by the MC example and mask them by the topography
+# Next, we load the lithology blocks created by the MC example and mask them by the topography. `topomask_ensemble`
+# masks all realizations at once and returns them as integer array of shape (n_realizations, n_cells).
 
 lith_blocks = np.load('../../data/outputs/MCexample_10realizations.npy')
 
-lith_blocks_topo = np.array([])
-for i in lith_blocks:
-    lith_blocks_topo = np.append(lith_blocks_topo, shemsuite.topomask(geo_model, i))
-lith_blocks_topo = lith_blocks_topo.reshape(len(lith_blocks), -1)
+lith_blocks_topo = shemsuite.topomask_ensemble(geo_model, lith_blocks)
 
 #%%
 # The model topography is not only important for the geological model, i.e. cutting geology with topography to produce a geological map, but is also vital for later on heat transport simulations.
@@ -90,63 +89,19 @@ lith_grid = np.round(lith_grid,0).astype('int')
 lith_grid_topo = shemsuite.topomask(geo_model, lith_grid)
 
 #%%
-# Then, we reshape the lithologies in the model resolution to get a 3D array, representing the model grid.
-
-res = geo_model._grid.regular_grid.resolution
-liths3D = lith_grid_topo.reshape((res), order='C')
-
-#%%
-# Now, we know that the maximum lithology is 12 (or if now, we can call it with ``geo_model.surfaces``), so we can check where in the 3D array the lithology ID is 13 and save 
-# these indices
-
-ijk = np.where(liths3D[:,:,:]==13)
-
-#%%
-# Let's now reshape the array for SHEMAT-Suite, which needs X, Y, Z
-ijk_shem = np.stack([ijk[0], ijk[1], ijk[2]], axis=1)
-
-#%% and get the topography and temperature assigned to theses indices
-
-head = np.zeros(len(ijk_shem))
-temp = np.zeros(len(ijk_shem))
-
-for i in range(len(ijk_shem)):
-    indices = ijk_shem[i,:2]
-    head[i] = dtm[:,:,2][indices[0], indices[1]]
-    temp[i] = surf_temp[indices[0], indices[1]]
-
-#%%
-# Next, we reshape the temperature and head boundary conditions back to a 1D vector and append them
-# to the ijk vector for SHEMAT-Suite
-
-head_reshaped = head.reshape(-1,1)
-temp_reshaped = temp.reshape(-1,1)
-
-ijkh = np.append(ijk_shem, head_reshaped, axis=1)
-ijkt = np.append(ijk_shem, temp_reshaped, axis=1)
-
-#%%
+# Now, we know that the maximum lithology is 12 (or if now, we can call it with ``geo_model.surfaces``), so all cells with lithology ID 13 are air.
+# For each of these cells, `topography_bcs` looks up the topography and the surface temperature, which we calculated above with the lapse rate,
+# and returns the boundary conditions as arrays with the columns i, j, k, value and direction. 
+#
 # It is important to remember, that indices between Python and Fortran (language of SHEMAt-Suite) are different.
-# Whil Python starts with 0, Fortran starts with 1. Hence, we have to add 1 to the first three columns of the ijk arrays
-# To make them Fortran compatible
-
-ijkh[:,:3] = ijkh[:,:3] + 1
-ijkt[:,:3] = ijkt[:,:3] + 1
+# Whil Python starts with 0, Fortran starts with 1. Hence, `topography_bcs` adds 1 to the cell indices to make them Fortran compatible.
+# It also adds the model height below sea-level (6500 m) to the head boundary condition. The two arrays with conditions assigned to single cells
+# are saved as txt files for later usage.
 
-# finally add the model height below sea-level to the head boundary condition
-ijkh[:,3] = ijkh[:,3] + 6500
-
-# SHEMAT requires an direction column for the boundary conditions 
-direction = np.zeros_like(head_reshaped)
-
-ijkh_d = np.append(ijkh, direction, axis=1)
-ijkt_d = np.append(ijkt, direction, axis=1)
-
-#%%
-# Now, that we have the two arrays with conditions assigned to single cells, we can save them as txt files for later usage
-
-np.savetxt('../../data/SHEMAT-Suite/POC_head_bcd.txt', ijkh_d, fmt='%d, %d, %d, %.3f, %d')
-np.savetxt('../../data/SHEMAT-Suite/POC_temp_bcd.txt', ijkt_d, fmt='%d, %d, %d, %.3f, %d')
+ijkh_d, ijkt_d = shemsuite.topography_bcs(geo_model, lith_grid_topo, dtm, lapse_rate=L, sea_temp=sea_temp,
+                                          head_offset=6500., air_id=13,
+                                          head_file='../../data/SHEMAT-Suite/POC_head_bcd.txt',
+                                          temp_file='../../data/SHEMAT-Suite/POC_temp_bcd.txt')
 
 #%%
 # Now we prepared the lithologies, which are necessary for the `# uindex` field in a SHEMA-Suite input file, we can prepare the other parameters. Of which some are necessary, like the model
@@ -196,24 +151,38 @@ units = units.append(air, ignore_index=True)
 # ----------------------
 # We are now all set for combining the lithology arrays, the `# units` table, temperature data from boreholes
 # into a SHEMAT-Suite input file. For this, we use the method `export_shemat_suite_input_file` in 
-# OpenWF.shemat_preprocessing.
+# OpenWF.shemat_preprocessing. For a whole ensemble, `export_shemat_ensemble` builds the parts of the input file
+# which are the same for all realizations only once and then writes one file per lith block. With `n_workers` > 1, the
+# files are written by several processes in parallel. On Windows and macOS, this requires the call to be placed in an
+# `if __name__ == '__main__':` block of a script, so here the files are written serially. With `incremental=True`, a manifest of content hashes is kept next to the input files,
+# so re-running the export after changing e.g. a boundary condition file only rewrites the files which actually changed.
+#
+# Small variations of the input points may result in exactly the same lith block at model resolution. Such duplicates only need to be
+# exported and simulated once. `unique_realizations` finds the distinct realizations, we export only these and write a map from every
+# realization to the model representing it. Simulation results can later be fanned out to all realizations with `owf_ens.expand_unique`.
 
-shemade = ""
-for c in range(len(lith_blocks_topo)):
-    model = lith_blocks_topo[c,:]
-    model_name = f"POC_MC_{c}"
-    shemsuite.export_shemat_suite_input_file(geo_model, lithology_block=model, units=units,  
+unique, inverse = owf_ens.unique_realizations(lith_blocks_topo)
+print(f"{len(unique)} of {len(lith_blocks_topo)} realizations are distinct.")
+
+model_names = shemsuite.export_shemat_ensemble(geo_model, lith_blocks_topo[unique], units=units,  
                                    data_file=temp_data, head_bcs_file='../../data/SHEMAT-Suite/POC_head_bcd.txt',
                                    top_temp_bcs_file='../../data/SHEMAT-Suite/POC_temp_bcd.txt', lateral_boundaries='closed',
                                    path='../../models/SHEMAT-Suite_input/',
-                                  filename=model_name)
-    shemade += model_name + " \n"
-shemade += "POC_base_model"
-with open("../../models/SHEMAT-Suite_input/shemade.job", 'w') as jobfile:
-    jobfile.write(shemade)
+                                   filenames=[f"POC_MC_{i}" for i in unique], n_workers=1, incremental=True)
+owf_ens.write_realization_map('../../models/SHEMAT-Suite_input/realization_map.csv', model_names, inverse)
+shemsuite.write_shemade_job(model_names + ['POC_base_model'], path='../../models/SHEMAT-Suite_input/')
 
 shemsuite.export_shemat_suite_input_file(geo_model, lithology_block=lith_grid_topo, units=units,  
                                    data_file=temp_data, head_bcs_file='../../data/SHEMAT-Suite/POC_head_bcd.txt',
                                    top_temp_bcs_file='../../data/SHEMAT-Suite/POC_temp_bcd.txt', lateral_boundaries='closed',
                                    path='../../models/SHEMAT-Suite_input/',
-                                  filename='POC_base_model')
\ No newline at end of file
+                                  filename='POC_base_model')
+#%%
+# Initial temperature and head fields
+# -----------------------------------
+# The input files refer to initial fields `temp_init.h5` and `head_init.h5`. A layered conductive geotherm, calculated from the
+# thermal conductivities in the `units` table, is a much better starting point for the solver than a homogeneous field. Once the base model
+# is simulated, its final fields can be used instead, by passing the result file as `base_model_file` to `write_initial_fields`.
+
+temp_init = shemsuite.conductive_geotherm(geo_model, lith_grid_topo, units, surface_temp=surf_temp, heat_flow=0.07)
+shemsuite.write_initial_fields(geo_model, path='../../models/SHEMAT-Suite_input/', temp=temp_init)
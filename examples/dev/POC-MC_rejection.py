@@ -26,6 +26,8 @@ from gempy.bayesian.fields import probability, information_entropy
 plt.style.use(['seaborn-talk'])
 
 sys.path.append('../models/20210319_MC_no_middle_filling/')
+sys.path.append('../../')
+import OpenWF.postprocessing as owf_post
 
 print(f"Run mit GemPy version {gp.__version__}")
 
@@ -602,37 +604,27 @@ fids = glob.glob('H:PCT_SHEMAT/20210219_MC_outputs/*.h5')
 
 
 outpath = 'H:PCT_SHEMAT/20210219_MC_outputs\\'
-poTemp = []
-poUi = []
-dicfil = {}
-for fn in fids:
-    for i in accept:
-        if fn == outpath+f"PCT_MC_{i}var_TCt_final.h5":
-            dT,dui = extTui(fn, dimension=2, direction='y')
-            poTemp.append(dT)
-            poUi.append(dui)            
-            dicfil[fn.split('/')[-1]] = dui
-            
+accepted_files = [fn for fn in fids for i in accept if fn == outpath+f"PCT_MC_{i}var_TCt_final.h5"]
 
 
 # In[71]:
 
 
-poTempa = np.asarray(poTemp)
-poUia = np.asarray(poUi)
+# streaming statistics over the accepted realizations, the ensemble is never held in memory
+stats_temp = owf_post.ensemble_statistics(accepted_files, field='temp', n_workers=4)
+stats_ui = owf_post.ensemble_statistics(accepted_files, field='uindex', n_workers=4)
 accepta = np.asarray(accept)
-print(poUia.shape,poTempa.shape,accepta.shape)
+print(stats_temp['mean'].shape, stats_temp['n'], accepta.shape)
 np.savetxt('accepted_realisations',accepta,fmt='%i',delimiter=' ',newline='\n')
-#np.savetxt('posterior_Temps',poTempa,fmt='%.5f',delimiter=' ',newline='\n',header=" posterior 61 realizations for Temperature")
-#np.savetxt('posterior_Uindex',poUia,fmt='%i',delimiter=' ',newline='\n')
 
 
 # In[72]:
 
 
-# calculate mean temperature field and mean posterior uindex
-mTemp = np.mean(poTempa,axis=0)
-mUi = np.mean(poUia,axis=0)
+# calculate mean temperature field and mean posterior uindex in the y-section of the 3D statistics
+mTemp = stats_temp['mean'][:,25,:]
+mUi = stats_ui['mean'][:,25,:]
+sTemp = stats_temp['std'][:,25,:]
 # import y and z for visualising
 plfn = h5py.File('../models/20210219_MC_ensemble/PCT_base_model_final.h5','r')
 x = plfn['x'][0,0,:]
@@ -644,7 +636,7 @@ refT = plfn['temp'][:,25,:]
 # In[73]:
 
 
-poUi[0].shape
+stats_ui['mean'].shape
 
 
 # In[79]:
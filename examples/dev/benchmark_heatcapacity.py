@@ -0,0 +1,84 @@
+"""
+Benchmark of the heat capacity calculation
+==========================================
+
+Compares the former implementation of `heatcapacity`, which evaluates the Zyvoloski rational function with
+full-size temporary arrays, with the chunked Horner-form evaluation in OpenWF.postprocessing. Temperature and
+pressure are taken from a synthetic SHEMAT-Suite result file, the peak memory is traced with tracemalloc.
+"""
+
+#%%
+# import libraries
+import os,sys
+sys.path.append('../../')
+import time
+import tempfile
+import tracemalloc
+import numpy as np
+import h5py
+import OpenWF.postprocessing as pp
+
+# resolution (nz, ny, nx) of the synthetic model
+shape = (120, 100, 200)
+
+def former_heatcapacity(data):
+    """former implementation of heatcapacity"""
+    Y = pp._ENTHALPY_Y
+    Z = pp._ENTHALPY_Z
+
+    t = data['temp'][:,:,:]
+    p = data['pres'][:,:,:] * 1e-6
+
+    p2 = p*p
+    p3 = p2*p
+    t2 = t*t
+    t3 = t2*t
+    tp = p*t
+    tp2 = t*p2
+    t2p = t2*p
+
+    ta = Y[0] + Y[1]*p + Y[2]*p2 + Y[3]*p3 + Y[4]*t \
+        + Y[5]*t2 + Y[6]*t3 + Y[7]*tp + Y[8]*tp2 + Y[9]*t2p
+    tb = Z[0] + Z[1]*p + Z[2]*p2 + Z[3]*p3 + Z[4]*t \
+        + Z[5]*t2 + Z[6]*t3 + Z[7]*tp + Z[8]*tp2 + Z[9]*t2p
+    da = Y[4] + 2.0*Y[5]*t + 3.0*Y[6]*t2 + Y[7]*p \
+        + Y[8]*p2 + 2.0*Y[9]*tp
+    db = Z[4] + 2.0*Z[5]*t + 3.0*Z[6]*t2 + Z[7]*p \
+        + Z[8]*p2 + 2.0*Z[9]*tp
+    b2 = tb*tb
+
+    return (da/tb - ta*db/b2)*1.0e6
+
+def profile(function, *args, **kwargs):
+    """runtime and peak memory of a function call"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    values = function(*args, **kwargs)
+    runtime = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return values, runtime, peak
+
+#%%
+# synthetic result file with a geothermal gradient and hydrostatic pressure
+nz, ny, nx = shape
+z = (np.arange(nz) + 0.5) * 6000. / nz
+depth = (6000. - z)[:, None, None] * np.ones(shape)
+rng = np.random.default_rng(0)
+
+filepath = os.path.join(tempfile.mkdtemp(), 'synthetic_result.h5')
+with h5py.File(filepath, 'w') as f:
+    f['temp'] = 10. + 0.03 * depth + rng.normal(0, 1, shape)
+    f['pres'] = 1e5 + 1000. * 9.81 * depth
+
+#%%
+# compare runtime, peak memory and values
+with h5py.File(filepath, 'r') as f:
+    reference, t_old, m_old = profile(former_heatcapacity, f)
+    print(f"former:         {t_old:6.2f} s, peak {m_old/1e6:8.1f} MB")
+
+    for dtype in [np.float64, np.float32]:
+        cpf, t_new, m_new = profile(pp.heatcapacity, f, dtype=dtype)
+        error = np.abs(cpf - reference).max() / np.abs(reference).max()
+        print(f"chunked {np.dtype(dtype).name}: {t_new:6.2f} s, peak {m_new/1e6:8.1f} MB, max. relative deviation {error:.1e}")
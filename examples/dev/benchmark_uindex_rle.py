@@ -0,0 +1,52 @@
+"""
+Benchmark of the uindex run-length encoding
+===========================================
+
+Compares the former `itertools.groupby` encoder of the `# uindex` block with the vectorized encoder
+`format_uindex` in OpenWF.shemat_preprocessing. The lithologies are taken from the already exported
+SHEMAT-Suite input files `POC_MC_*`, so the benchmark also checks that the new encoder reproduces
+the existing files exactly.
+"""
+
+#%%
+# import libraries
+import os,sys
+sys.path.append('../../')
+import glob
+import timeit
+import itertools as it
+import numpy as np
+import OpenWF.shemat_preprocessing as shemsuite
+
+input_path = '../../models/SHEMAT-Suite_input/'
+
+def groupby_uindex(liths):
+    """former encoder of export_shemat_suite_input_file"""
+    sequence = [len(list(group)) for key, group in it.groupby(liths)]
+    unit_id = [key for key, group in it.groupby(liths)]
+    combined = ["%s*%s" % (pair) for pair in zip(sequence,unit_id)]
+
+    return " ".join(combined)
+
+def read_uindex_block(filepath):
+    """read the uindex block of an input file and decode it to a 1D array in Fortran order"""
+    with open(filepath, 'r') as file:
+        content = file.read()
+    block = content.split('# uindex\n')[-1].strip()
+    model = shemsuite.read_shemat_input(filepath)
+
+    return block, model['uindex'].flatten('F')
+
+#%%
+# check and time the encoders for every exported realization
+
+for fid in sorted(glob.glob(input_path+'POC_MC_*')):
+    block, liths = read_uindex_block(fid)
+
+    assert groupby_uindex(liths) == block
+    assert shemsuite.format_uindex(liths) == block
+
+    t_old = min(timeit.repeat(lambda: groupby_uindex(liths), number=1, repeat=5))
+    t_new = min(timeit.repeat(lambda: shemsuite.format_uindex(liths), number=1, repeat=5))
+    print(f"{os.path.basename(fid)}: {liths.size} cells, groupby {t_old*1e3:.1f} ms, "
+          f"numpy {t_new*1e3:.1f} ms, speedup {t_old/t_new:.1f}x")